@@ -1,35 +1,56 @@
-import pytz
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.responses import RedirectResponse
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
+from typing import List, Literal, Optional
+import base64
+import os
 import datetime
 from datetime import timedelta
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
+import anyio.to_thread
 
 import crud
 import models
 import auth
 import google_calendar
-from database import SessionLocal
-import globals
+import availability
+import availability_store
+import freebusy_cache
+import freebusy_coalescer
+import event_mirror
+import http_cache
+import json_response
+import metrics
+import profiling
+import slot_format
+import timezones
+import booking_ledger
+import config_cache
+import user_cache
+from calendar_client import client as calendar_client
+from circuit_breaker import CalendarTimeoutError, CalendarUnavailableError
+from googleapiclient.errors import HttpError
+from database import SessionLocal, get_db
+import app_state
 
 router = APIRouter()
 
-# Dependency to get a DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+BULK_BOOKING_MAX_ITEMS = int(os.getenv("BULK_BOOKING_MAX_ITEMS", "5000"))
+# Days computed per busy-times fetch when availability is streamed or paginated.
+AVAILABILITY_WINDOW_DAYS = int(os.getenv("AVAILABILITY_WINDOW_DAYS", "7"))
+AVAILABILITY_MAX_PAGE_SIZE = int(os.getenv("AVAILABILITY_MAX_PAGE_SIZE", "500"))
+# Window sizes, in days, searched in turn by /availability/next; the last one repeats.
+NEXT_SLOTS_WINDOW_DAYS = (1, 7, 30)
+NEXT_SLOTS_HORIZON_DAYS = int(os.getenv("NEXT_SLOTS_HORIZON_DAYS", "365"))
+NEXT_SLOTS_MAX_COUNT = int(os.getenv("NEXT_SLOTS_MAX_COUNT", "100"))
 
-def get_calendar_service():
+async def get_calendar_service():
     """
     Dependency to get an authorized Google Calendar service instance.
     If not authorized, raises an exception.
     """
-    service = google_calendar.get_calendar_service()
+    service = await calendar_client.get_service()
     if service is None:
         raise HTTPException(status_code=401, detail="Not authenticated. Please visit /auth/google to authorize.")
     return service
@@ -39,9 +60,17 @@ class InitialAdminUser(models.BaseModel):
     username: str
     password: str
 
+def _claim_setup(db: Session):
+    # Clearing the shared flag first means only one request, on any worker, can get past here.
+    return app_state.claim_setup(db) and crud.get_users_count(db) == 0
+
+def _reopen_setup(db: Session):
+    db.rollback()
+    app_state.set_setup_needed(db, True)
+
 @router.post("/initial-setup", response_model=models.UserInDB)
-def create_initial_admin_user(user_data: InitialAdminUser, db: Session = Depends(get_db)):
-    if not globals.initial_admin_setup_needed:
+async def create_initial_admin_user(user_data: InitialAdminUser, db: Session = Depends(get_db)):
+    if not await run_in_threadpool(_claim_setup, db):
         # This endpoint should not be called if setup is not needed.
         # The frontend should prevent this.
         raise HTTPException(status_code=400, detail="Initial setup is not required.")
@@ -52,25 +81,25 @@ def create_initial_admin_user(user_data: InitialAdminUser, db: Session = Depends
         password=user_data.password,
         is_admin=True
     )
-    db_user = crud.get_user_by_username(db, username=admin_user_create.username)
-    if db_user:
-        raise HTTPException(status_code=400, detail="Username already registered.")
-    
-    created_user = crud.create_user(db=db, user=admin_user_create)
-    globals.initial_admin_setup_needed = False # Mark setup as complete
+    try:
+        hashed_password = await auth.hash_password_async(admin_user_create.password)
+        created_user = await run_in_threadpool(crud.create_user, db, admin_user_create, hashed_password)
+    except Exception:
+        await run_in_threadpool(_reopen_setup, db)
+        raise
     return created_user
 
 
 
 @router.get("/initial-setup", response_model=models.SetupStatus)
-def initial_setup_status():
-    return {"setup_needed": globals.initial_admin_setup_needed}
+def initial_setup_status(db: Session = Depends(get_db)):
+    return {"setup_needed": app_state.is_setup_needed(db)}
 
 
 @router.post("/token", response_model=auth.Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(crud.get_user_by_username, db, username=form_data.username)
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -83,11 +112,12 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/users", response_model=models.UserInDB)
-def create_user(user: models.UserCreate, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+async def create_user(user: models.UserCreate, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await auth.hash_password_async(user.password)
+    return await run_in_threadpool(crud.create_user, db, user, hashed_password)
 
 @router.get("/users", response_model=List[models.UserInDB])
 def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
@@ -95,11 +125,12 @@ def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), c
     return users
 
 @router.put("/users/{user_id}", response_model=models.UserInDB)
-def update_user(user_id: int, user_updates: models.UserUpdate, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def update_user(user_id: int, user_updates: models.UserUpdate, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    db_user = await run_in_threadpool(crud.get_user, db, user_id=user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    return crud.update_user(db=db, user=db_user, updates=user_updates)
+    hashed_password = await auth.hash_password_async(user_updates.password) if user_updates.password else None
+    return await run_in_threadpool(crud.update_user, db, db_user, user_updates, hashed_password)
 
 @router.delete("/users/{user_id}", response_model=models.UserInDB)
 def delete_user(user_id: int, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
@@ -121,11 +152,15 @@ def create_availability_config(config: models.AvailabilityConfig, db: Session =
     return config
 
 @router.get("/config", response_model=models.AvailabilityConfig)
-def read_availability_config(db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
-    db_config = crud.get_config(db)
-    if not db_config:
+def read_availability_config(request: Request, response: Response, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    compiled_config = config_cache.get_compiled_config(db)
+    if not compiled_config:
         raise HTTPException(status_code=404, detail="Configuration not found.")
-    return models.AvailabilityConfig.parse_obj(db_config.data)
+    etag = http_cache.make_etag("config", compiled_config.version)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag, http_cache.CONFIG_CACHE_MAX_AGE_SECONDS)
+    response.headers.update(http_cache.cache_headers(etag, http_cache.CONFIG_CACHE_MAX_AGE_SECONDS))
+    return compiled_config.config
 
 @router.put("/config", response_model=models.AvailabilityConfig)
 def update_availability_config(config: models.AvailabilityConfig, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
@@ -139,96 +174,481 @@ def delete_availability_config(db: Session = Depends(get_db), current_user: mode
     crud.delete_config(db)
     return {"message": "Configuration deleted successfully."}
 
+def _encode_cursor(slot_start: str):
+    return base64.urlsafe_b64encode(slot_start.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        after = datetime.datetime.fromisoformat(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Cursors are slot starts, which always carry an offset.
+    if after.tzinfo is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+async def _iter_slot_windows(compiled_config, start_date: datetime.date, end_date: datetime.date, user_tz, service, db: Session):
+    """
+    Yields the free slots of the range AVAILABILITY_WINDOW_DAYS days at a time,
+    fetching the busy times of each window only when it is reached.
+    """
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + timedelta(days=AVAILABILITY_WINDOW_DAYS - 1), end_date)
+        time_min, time_max = timezones.day_bounds(user_tz, window_start, window_end)
+        with profiling.phase("freebusy_fetch"):
+            busy_times = await calendar_client.get_busy_times(service, db, time_min, time_max)
+        with profiling.phase("slot_generation"):
+            slots = await run_in_threadpool(
+                availability.compute_available_slots, compiled_config, window_start, window_end, user_tz, busy_times
+            )
+        yield slots
+        window_start = window_end + timedelta(days=1)
+
 @router.get("/availability")
-def get_availability(start_date: datetime.date, end_date: datetime.date, timezone: str, service = Depends(get_calendar_service), db: Session = Depends(get_db)):
-    db_config = crud.get_config(db)
-    if not db_config:
+async def get_availability(request: Request, start_date: datetime.date, end_date: datetime.date, timezone: str, stream: bool = False, limit: Optional[int] = Query(None, ge=1, le=AVAILABILITY_MAX_PAGE_SIZE), cursor: Optional[str] = None, format: Optional[Literal["full", "compact"]] = None, service = Depends(get_calendar_service), db: Session = Depends(get_db)):
+    """
+    Free slots between start_date and end_date (inclusive).
+
+    With stream=true the slots are sent as NDJSON, one slot per line, as each
+    window of days is computed. With limit, at most that many slots are
+    returned along with a next_cursor to pass back for the following page
+    (null on the last page).
+
+    format=compact, or an Accept header naming slot_format.COMPACT_MEDIA_TYPE,
+    returns available_slots in the compact format described in slot_format;
+    streamed slots are always in the full format.
+
+    Whole-range responses carry an ETag derived from the config version, the
+    busy times and the query; a matching If-None-Match gets 304 before the
+    slots are generated.
+    """
+    with profiling.phase("config_load"):
+        compiled_config = await run_in_threadpool(config_cache.load_compiled_config)
+    if not compiled_config:
+        raise HTTPException(status_code=404, detail="Configuration not found. Please set the availability rules first.")
+
+    try:
+        user_tz = timezones.get_timezone(timezone)
+    except timezones.UnknownTimeZoneError:
+        raise HTTPException(status_code=400, detail="Invalid timezone")
+
+    if stream:
+        async def lines():
+            # A streamed response outlives the request's get_db session.
+            stream_db = SessionLocal()
+            try:
+                async for slots in _iter_slot_windows(compiled_config, start_date, end_date, user_tz, service, stream_db):
+                    if slots:
+                        yield b"".join(json_response.dumps(slot) + b"\n" for slot in slots)
+            finally:
+                stream_db.close()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    response_format = slot_format.negotiate(request, format)
+    duration_minutes = compiled_config.config.appointment_duration_minutes
+
+    def slots_response(slots, headers=None, **extra):
+        with profiling.phase("serialization"):
+            slots = slot_format.encode(slots, response_format, user_tz, duration_minutes)
+        headers = {**(headers or {}), "Vary": "Accept"}
+        return _json_response({"available_slots": slots, **extra}, headers, media_type=slot_format.media_type(response_format))
+
+    if limit is not None or cursor is not None:
+        after = _decode_cursor(cursor) if cursor else None
+        if after is not None:
+            start_date = max(start_date, after.astimezone(user_tz).date())
+        limit = limit or AVAILABILITY_MAX_PAGE_SIZE
+        page = []
+        async for slots in _iter_slot_windows(compiled_config, start_date, end_date, user_tz, service, db):
+            if after is not None:
+                # Only the first window can hold slots of earlier pages.
+                slots = [slot for slot in slots if datetime.datetime.fromisoformat(slot["start_time"]) >= after]
+                after = None
+            page.extend(slots)
+            if len(page) > limit:
+                return slots_response(page[:limit], next_cursor=_encode_cursor(page[limit]["start_time"]))
+        return slots_response(page, next_cursor=None)
+
+    time_min, time_max = timezones.day_bounds(user_tz, start_date, end_date)
+    query = (start_date, end_date, user_tz.key, response_format)
+    max_age = http_cache.AVAILABILITY_CACHE_MAX_AGE_SECONDS
+    if availability_store.AVAILABILITY_STORE_ENABLED and (end_date - start_date).days < availability_store.AVAILABILITY_STORE_DAYS:
+        available_slots = await _stored_availability(compiled_config, start_date, end_date, user_tz, service, db)
+        # The stored slots are cheap to read; the validator spares the serialization and the transfer.
+        etag = http_cache.make_etag("availability", compiled_config.version, http_cache.fingerprint(available_slots), *query)
+        if http_cache.is_fresh(request, etag):
+            return http_cache.not_modified(etag, max_age, vary="Accept")
+        return slots_response(available_slots, http_cache.cache_headers(etag, max_age))
+
+    with profiling.phase("freebusy_fetch"):
+        busy_times = await calendar_client.get_busy_times(service, db, time_min, time_max)
+
+    etag = http_cache.make_etag(
+        "availability", compiled_config.version, http_cache.fingerprint(availability.normalize_busy_times(busy_times)), *query
+    )
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag, max_age, vary="Accept")
+
+    with profiling.phase("slot_generation"):
+        available_slots = await run_in_threadpool(
+            availability.compute_available_slots, compiled_config, start_date, end_date, user_tz, busy_times
+        )
+
+    return slots_response(available_slots, http_cache.cache_headers(etag, max_age))
+
+def _json_response(content, headers=None, media_type=None):
+    """Serializes the response in the endpoint, so profiled requests can time it."""
+    with profiling.phase("serialization"):
+        return json_response.FastJSONResponse(content, headers=headers, media_type=media_type)
+
+def _ending_transaction(function, db: Session, *args):
+    """function(db, *args), then ends db's transaction so its connection is not held across the next await."""
+    result = function(db, *args)
+    db.commit()
+    return result
+
+async def _stored_availability(compiled_config, start_date: datetime.date, end_date: datetime.date, user_tz, service, db: Session):
+    """Slots from availability_store, computing and storing only the days it is missing."""
+    with profiling.phase("store_read"):
+        days = await run_in_threadpool(_ending_transaction, availability_store.get_days, db, user_tz.key, start_date, end_date)
+    span = availability_store.missing_span(days, start_date, end_date)
+    if span:
+        time_min, time_max = timezones.day_bounds(user_tz, span[0], span[1])
+        fetched_at = datetime.datetime.utcnow()
+        try:
+            with profiling.phase("freebusy_fetch"):
+                busy_times = await calendar_client.get_calendar_busy_times(service, db, time_min, time_max, raise_errors=True)
+        except HttpError as error:
+            # Served as without the store, but never stored: the days are not known to be free.
+            print(f'An error occurred: {error}')
+            with profiling.phase("slot_generation"):
+                days.update(await run_in_threadpool(
+                    availability_store.compute_days, compiled_config, span[0], span[1], user_tz, []
+                ))
+        else:
+            with profiling.phase("slot_generation"):
+                days.update(await run_in_threadpool(
+                    availability_store.compute_and_store, db, compiled_config, span[0], span[1], user_tz, busy_times, fetched_at
+                ))
+
+    slots = [slot for day in sorted(days) for slot in days[day]]
+    time_min, time_max = timezones.day_bounds(user_tz, start_date, end_date)
+    with profiling.phase("claims"):
+        return await run_in_threadpool(_ending_transaction, availability_store.without_claims, db, slots, time_min, time_max)
+
+@router.get("/availability/next")
+async def get_next_available_slots(timezone: str, count: int = Query(1, ge=1, le=NEXT_SLOTS_MAX_COUNT), after: Optional[datetime.datetime] = None, service = Depends(get_calendar_service), db: Session = Depends(get_db)):
+    """
+    The earliest count free slots starting at or after `after` (default: now).
+    Busy times are fetched for growing windows, a day, a week, then a month at
+    a time, until enough slots are found or NEXT_SLOTS_HORIZON_DAYS is reached.
+    """
+    with profiling.phase("config_load"):
+        compiled_config = await run_in_threadpool(config_cache.load_compiled_config)
+    if not compiled_config:
         raise HTTPException(status_code=404, detail="Configuration not found. Please set the availability rules first.")
 
-    config = models.AvailabilityConfig.parse_obj(db_config.data)
-    available_slots = []
-    
     try:
-        user_tz = pytz.timezone(timezone)
-    except pytz.UnknownTimeZoneError:
+        user_tz = timezones.get_timezone(timezone)
+    except timezones.UnknownTimeZoneError:
         raise HTTPException(status_code=400, detail="Invalid timezone")
 
-    time_min = user_tz.localize(datetime.datetime.combine(start_date, datetime.time.min))
-    time_max = user_tz.localize(datetime.datetime.combine(end_date, datetime.time.max))
-    busy_times = google_calendar.get_busy_times(service, time_min, time_max)
-
-    current_day = start_date
-    while current_day <= end_date:
-        rule_for_day = next((rule for rule in config.rules if rule.day_of_week == current_day.weekday()), None)
-
-        if rule_for_day and rule_for_day.is_available:
-            for work_hour_range in rule_for_day.work_hours:
-                slot_start = user_tz.localize(datetime.datetime.combine(current_day, work_hour_range.start))
-                slot_end = slot_start + timedelta(minutes=config.appointment_duration_minutes)
-                
-                work_period_end = user_tz.localize(datetime.datetime.combine(current_day, work_hour_range.end))
-
-                while slot_end <= work_period_end:
-                    is_in_break = False
-                    if config.breaks:
-                        for break_range in config.breaks:
-                            break_start = user_tz.localize(datetime.datetime.combine(current_day, break_range.start))
-                            break_end = user_tz.localize(datetime.datetime.combine(current_day, break_range.end))
-                            if max(slot_start, break_start) < min(slot_end, break_end):
-                                is_in_break = True
-                                break
-                    if is_in_break:
-                        slot_start = slot_end
-                        slot_end += timedelta(minutes=config.appointment_duration_minutes)
-                        continue
-
-                    is_busy = False
-                    for busy in busy_times:
-                        busy_start = busy['start'].astimezone(user_tz)
-                        busy_end = busy['end'].astimezone(user_tz)
-                        if max(slot_start, busy_start) < min(slot_end, busy_end):
-                            is_busy = True
-                            break
-                    
-                    if not is_busy:
-                        available_slots.append({
-                            "start_time": slot_start.isoformat(),
-                            "end_time": slot_end.isoformat(),
-                        })
-
-                    slot_start = slot_end
-                    slot_end += timedelta(minutes=config.appointment_duration_minutes)
-
-        current_day += timedelta(days=1)
-
-    return {"available_slots": available_slots}
+    if after is None:
+        after = datetime.datetime.now(datetime.timezone.utc)
+    elif after.tzinfo is None:
+        after = timezones.localize(user_tz, after)
+    first_day = after.astimezone(user_tz).date()
+    horizon = first_day + timedelta(days=NEXT_SLOTS_HORIZON_DAYS - 1)
+
+    found = []
+    if not any(compiled_config.work_hours_by_weekday):
+        return {"available_slots": found}
+    window_start = first_day
+    window_sizes = iter(NEXT_SLOTS_WINDOW_DAYS)
+    window_days = next(window_sizes)
+    while window_start <= horizon and len(found) < count:
+        window_end = min(window_start + timedelta(days=window_days - 1), horizon)
+        time_min, time_max = timezones.day_bounds(user_tz, window_start, window_end)
+        with profiling.phase("freebusy_fetch"):
+            busy_times = await calendar_client.get_busy_times(service, db, time_min, time_max)
+        with profiling.phase("slot_generation"):
+            found += await run_in_threadpool(
+                availability.first_available_slots, compiled_config, window_start, window_end, user_tz, busy_times, after, count - len(found)
+            )
+        window_start = window_end + timedelta(days=1)
+        window_days = next(window_sizes, window_days)
+
+    return _json_response({"available_slots": found})
+
+@router.get("/resources", response_model=List[models.ResourceConfig])
+def read_resources(db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    return [models.ResourceConfig.model_validate(db_resource) for db_resource in crud.get_resources(db)]
+
+@router.put("/resources/{name}", response_model=models.ResourceConfig)
+def upsert_resource(name: str, resource: models.ResourceConfig, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    if resource.name != name:
+        raise HTTPException(status_code=400, detail="Resource name does not match the URL.")
+    crud.upsert_resource(db, resource)
+    return resource
+
+@router.delete("/resources/{name}")
+def delete_resource(name: str, db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    if not crud.delete_resource(db, name):
+        raise HTTPException(status_code=404, detail="Resource not found.")
+    return {"message": "Resource deleted successfully."}
+
+@router.get("/team-availability")
+async def get_team_availability(start_date: datetime.date, end_date: datetime.date, timezone: str, mode: Literal["any", "all"] = "any", resources: Optional[str] = None, service = Depends(get_calendar_service), db: Session = Depends(get_db)):
+    """
+    Availability across a pool of resources (comma-separated names, all
+    resources by default). mode=any returns the slots at least one resource is
+    free for, mode=all those every resource is free for.
+    """
+    compiled_resources = await run_in_threadpool(config_cache.load_compiled_resources)
+    names = [name.strip() for name in resources.split(',') if name.strip()] if resources else list(compiled_resources)
+    if not names:
+        raise HTTPException(status_code=404, detail="No resources configured.")
+    unknown = [name for name in names if name not in compiled_resources]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown resources: {', '.join(unknown)}")
+
+    try:
+        user_tz = timezones.get_timezone(timezone)
+    except timezones.UnknownTimeZoneError:
+        raise HTTPException(status_code=400, detail="Invalid timezone")
+
+    selected = [compiled_resources[name] for name in dict.fromkeys(names)]
+    calendar_ids = list(dict.fromkeys(resource.calendar_id for resource in selected))
+    time_min, time_max = timezones.day_bounds(user_tz, start_date, end_date)
+    busy_times = await calendar_client.get_busy_times_many(service, db, calendar_ids, time_min, time_max)
+
+    available_slots = await run_in_threadpool(
+        availability.compute_team_slots, selected, start_date, end_date, user_tz, busy_times, mode == "all"
+    )
+
+    return _json_response({"available_slots": available_slots})
 
 @router.post("/book")
-def book_appointment(booking_request: models.BookingRequest, service = Depends(get_calendar_service), db: Session = Depends(get_db)):
-    db_config = crud.get_config(db)
-    if not db_config:
+async def book_appointment(booking_request: models.BookingRequest, service = Depends(get_calendar_service), db: Session = Depends(get_db)):
+    if not await run_in_threadpool(config_cache.load_compiled_config):
         raise HTTPException(status_code=404, detail="Configuration not found.")
 
-    summary = f"Appointment with {booking_request.user_details.get('name', 'New Client')}"
-    description = f"Details: {booking_request.user_details.get('details', 'No details provided.')}"
-    
+    summary, description = _event_details(booking_request)
+
+    try:
+        booking_id = await run_in_threadpool(booking_ledger.claim, db, booking_request.start_time, booking_request.end_time)
+    except booking_ledger.SlotTakenError:
+        raise HTTPException(status_code=409, detail="This slot has already been booked.")
+
     timezone = str(booking_request.start_time.tzinfo)
-    created_event = google_calendar.create_event(service, booking_request.start_time, booking_request.end_time, summary, description, timezone=timezone)
+    try:
+        created_event = await calendar_client.create_event(service, booking_request.start_time, booking_request.end_time, summary, description, timezone=timezone)
+    except CalendarTimeoutError:
+        # The event may still be created; the pending claim keeps the slot until it expires.
+        raise
+    except BaseException:
+        await run_in_threadpool(booking_ledger.release, db, booking_id)
+        raise
 
     if created_event:
+        await run_in_threadpool(booking_ledger.confirm, db, booking_id, created_event.get('id'))
+        freebusy_cache.invalidate(booking_request.start_time, booking_request.end_time)
+        if event_mirror.EVENT_MIRROR_ENABLED:
+            await run_in_threadpool(event_mirror.record_event, db, created_event)
         return {"message": "Appointment booked successfully.", "appointment": created_event}
     else:
+        await run_in_threadpool(booking_ledger.release, db, booking_id)
         raise HTTPException(status_code=500, detail="Failed to create calendar event.")
 
+def _event_details(booking_request: models.BookingRequest):
+    summary = f"Appointment with {booking_request.user_details.get('name', 'New Client')}"
+    description = f"Details: {booking_request.user_details.get('details', 'No details provided.')}"
+    return summary, description
+
+def _claim_all(db: Session, bookings):
+    """Claims each (index, booking) pair; returns the booking ids, None where the slot is taken."""
+    booking_ids = []
+    for _, booking_request in bookings:
+        try:
+            booking_ids.append(booking_ledger.claim(db, booking_request.start_time, booking_request.end_time))
+        except booking_ledger.SlotTakenError:
+            booking_ids.append(None)
+    return booking_ids
+
+def _settle_all(db: Session, outcomes):
+    """Confirms the claims whose event was created and releases the others."""
+    for booking_id, created_event in outcomes:
+        if created_event:
+            booking_ledger.confirm(db, booking_id, created_event.get('id'))
+            if event_mirror.EVENT_MIRROR_ENABLED:
+                event_mirror.record_event(db, created_event)
+        else:
+            booking_ledger.release(db, booking_id)
+
+async def _book_in_batches(service, bookings):
+    """
+    Claims and inserts the bookings BATCH_MAX_REQUESTS at a time, yielding a
+    result per booking as each batch completes.
+    """
+    # A streamed response outlives the request's get_db session.
+    db = SessionLocal()
+    try:
+        indexed = list(enumerate(bookings))
+        for offset in range(0, len(indexed), google_calendar.BATCH_MAX_REQUESTS):
+            chunk = indexed[offset:offset + google_calendar.BATCH_MAX_REQUESTS]
+            booking_ids = await run_in_threadpool(_claim_all, db, chunk)
+            claimed = [(item, booking_id) for item, booking_id in zip(chunk, booking_ids) if booking_id is not None]
+
+            for (index, _), booking_id in zip(chunk, booking_ids):
+                if booking_id is None:
+                    yield {"index": index, "status": "conflict", "error": "This slot has already been booked."}
+            if not claimed:
+                continue
+
+            events = []
+            for (_, booking_request), _ in claimed:
+                summary, description = _event_details(booking_request)
+                events.append(google_calendar.event_body(
+                    booking_request.start_time, booking_request.end_time, summary, description,
+                    timezone=str(booking_request.start_time.tzinfo),
+                ))
+            try:
+                results = await calendar_client.create_events_batch(service, events)
+            except CalendarUnavailableError as error:
+                if not isinstance(error, CalendarTimeoutError):
+                    # Nothing was inserted; a timed out batch keeps its claims until they expire.
+                    await run_in_threadpool(_settle_all, db, [(booking_id, None) for _, booking_id in claimed])
+                for (index, _), _ in claimed:
+                    yield {"index": index, "status": "failed", "error": str(error)}
+                continue
+            except HttpError as error:
+                results = [(None, str(error))] * len(claimed)
+
+            await run_in_threadpool(_settle_all, db, [
+                (booking_id, created_event) for (_, booking_id), (created_event, _) in zip(claimed, results)
+            ])
+            for ((index, booking_request), _), (created_event, error) in zip(claimed, results):
+                if created_event:
+                    freebusy_cache.invalidate(booking_request.start_time, booking_request.end_time)
+                    yield {"index": index, "status": "booked", "event_id": created_event.get('id')}
+                else:
+                    yield {"index": index, "status": "failed", "error": error}
+    finally:
+        db.close()
+
+@router.post("/book/bulk")
+async def bulk_book_appointments(bulk_request: models.BulkBookingRequest, stream: bool = False, service = Depends(get_calendar_service), db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    """
+    Books many appointments, e.g. for imports, sending the inserts to Google in
+    batch requests. Every booking is validated against the configuration before
+    anything is booked. With stream=true the response is NDJSON: one line per
+    booking as its batch completes, then a summary line.
+    """
+    compiled_config = await run_in_threadpool(config_cache.load_compiled_config)
+    if not compiled_config:
+        raise HTTPException(status_code=404, detail="Configuration not found.")
+    if len(bulk_request.bookings) > BULK_BOOKING_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_BOOKING_MAX_ITEMS} bookings per request.")
+
+    invalid = []
+    for index, booking_request in enumerate(bulk_request.bookings):
+        error = availability.booking_error(compiled_config, booking_request.start_time, booking_request.end_time)
+        if error:
+            invalid.append({"index": index, "error": error})
+    if invalid:
+        raise HTTPException(status_code=422, detail=invalid)
+
+    results = _book_in_batches(service, bulk_request.bookings)
+
+    def summarize(counts):
+        return {"total": len(bulk_request.bookings), **{status: counts.get(status, 0) for status in ("booked", "conflict", "failed")}}
+
+    if stream:
+        async def lines():
+            counts = {}
+            async for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                yield json_response.dumps(result) + b"\n"
+            yield json_response.dumps({"summary": summarize(counts)}) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    collected = sorted([result async for result in results], key=lambda result: result["index"])
+    counts = {}
+    for result in collected:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"summary": summarize(counts), "results": collected}
+
+@router.get("/cache-stats")
+def read_cache_stats(current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    return {
+        "freebusy": freebusy_cache.cache.stats(),
+        "freebusy_coalescing": freebusy_coalescer.coalescer.stats(),
+        "credentials": google_calendar.credentials_store.stats(),
+        "google_calendar": calendar_client.stats(),
+        "password_hashing": auth.hash_pool_stats(),
+        "users": user_cache.users.stats(),
+        "tokens": user_cache.tokens.stats(),
+    }
+
+@router.get("/profiles")
+def read_profiles(current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    """Profiles of the requests made with profile=true, most recent first."""
+    return [profile.summary() for profile in profiling.store.list()]
+
+def _get_profile(profile_id: str):
+    profile = profiling.store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found. Profiles are kept in memory by the worker that served the request.")
+    return profile
+
+@router.get("/profiles/{profile_id}")
+def read_profile(profile_id: str, current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    return _get_profile(profile_id).report()
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+def read_profile_collapsed(profile_id: str, current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+    """Collapsed stacks, the input format of flamegraph.pl and speedscope."""
+    return PlainTextResponse(_get_profile(profile_id).collapsed())
+
+def _collect_stats():
+    """/metrics samples taken from the same sources as /cache-stats, plus threadpool usage."""
+    for name, cache in (("freebusy", freebusy_cache.cache), ("users", user_cache.users), ("tokens", user_cache.tokens)):
+        stats = cache.stats()
+        yield "cache_hits_total", "counter", "Cache hits.", {"cache": name}, stats["hits"]
+        yield "cache_misses_total", "counter", "Cache misses.", {"cache": name}, stats["misses"]
+        yield "cache_entries", "gauge", "Entries currently cached.", {"cache": name}, stats["entries"]
+
+    coalescing = freebusy_coalescer.coalescer.stats()
+    yield "freebusy_queries_issued_total", "counter", "Free/busy queries sent to Google.", {}, coalescing["issued"]
+    yield "freebusy_queries_coalesced_total", "counter", "Free/busy queries served by an in-flight query.", {}, coalescing["coalesced"]
+    credentials = google_calendar.credentials_store.stats()
+    yield "google_token_refreshes_total", "counter", "OAuth token refreshes done by this worker.", {}, credentials["refreshes"]
+
+    google = calendar_client.stats()
+    yield "google_api_timeouts_total", "counter", "Google Calendar calls given up on after the timeout.", {}, google["timeouts"]
+    yield "google_circuit_open", "gauge", "1 while the Google Calendar circuit breaker is not closed.", {}, int(google["circuit"]["state"] != "closed")
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    pools = (
+        ("default", limiter.borrowed_tokens, limiter.total_tokens),
+        ("google", google["pending"], google["max_pending"]),
+        ("password_hashing", auth.hash_pool_stats()["pending"], auth.PASSWORD_HASH_MAX_QUEUE),
+    )
+    for pool, busy, capacity in pools:
+        yield "threadpool_busy", "gauge", "Calls running or queued on a worker pool.", {"pool": pool}, busy
+        yield "threadpool_capacity", "gauge", "Calls a worker pool accepts before callers wait or are rejected.", {"pool": pool}, capacity
+
+metrics.register_collector(_collect_stats)
+
 @router.get("/events")
-def get_events(start_date: datetime.date, end_date: datetime.date, timezone: str, service = Depends(get_calendar_service), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
+async def get_events(start_date: datetime.date, end_date: datetime.date, timezone: str, service = Depends(get_calendar_service), db: Session = Depends(get_db), current_user: models.UserInDB = Depends(auth.get_current_admin_user)):
     try:
-        user_tz = pytz.timezone(timezone)
-    except pytz.UnknownTimeZoneError:
+        user_tz = timezones.get_timezone(timezone)
+    except timezones.UnknownTimeZoneError:
         raise HTTPException(status_code=400, detail="Invalid timezone")
 
-    time_min = user_tz.localize(datetime.datetime.combine(start_date, datetime.time.min))
-    time_max = user_tz.localize(datetime.datetime.combine(end_date, datetime.time.max))
+    time_min, time_max = timezones.day_bounds(user_tz, start_date, end_date)
     
-    events = google_calendar.get_events(service, time_min, time_max)
+    events = await calendar_client.get_events(service, db, time_min, time_max)
     return {"events": events}
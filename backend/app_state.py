@@ -0,0 +1,138 @@
+"""
+Application state shared by every worker process through the app_state table.
+
+Values are small JSON documents stored by key, optionally with an expiry.
+get_value() serves reads from a per-process cache for
+APP_STATE_CACHE_TTL_SECONDS, so a value changed by another worker shows up
+there within that time; writes go straight to the database and update the
+local cache.
+
+Decisions that must happen once across all workers do not read the cache:
+add_value() only inserts a missing key, compare_and_set() is a single
+conditional UPDATE, and consume_oauth_state() deletes the pending state it
+checks, so a state is accepted at most once whichever worker the OAuth
+callback lands on.
+"""
+import datetime
+import json
+import os
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from ttl_cache import TTLCache
+
+APP_STATE_CACHE_TTL_SECONDS = float(os.getenv("APP_STATE_CACHE_TTL_SECONDS", "5"))
+OAUTH_STATE_TTL_SECONDS = float(os.getenv("OAUTH_STATE_TTL_SECONDS", "600"))
+
+SETUP_NEEDED = "initial_admin_setup_needed"
+OAUTH_STATE_PREFIX = "oauth_state:"
+
+cache = TTLCache(256, APP_STATE_CACHE_TTL_SECONDS)
+_MISSING = object()
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def _live(key: str):
+    return (models.AppState.key == key) & or_(models.AppState.expires_at.is_(None), models.AppState.expires_at > _utcnow())
+
+
+def get_value(db: Session, key: str, default=None):
+    """The value stored under key, possibly up to APP_STATE_CACHE_TTL_SECONDS old."""
+    value = cache.get(key)
+    if value is None:
+        row = db.query(models.AppState.value).filter(_live(key)).first()
+        value = json.loads(row.value) if row else _MISSING
+        cache.put(key, value)
+    return default if value is _MISSING else value
+
+
+def set_value(db: Session, key: str, value, ttl_seconds: float = None):
+    """Stores value under key, replacing any previous one, and commits."""
+    expires_at = _utcnow() + datetime.timedelta(seconds=ttl_seconds) if ttl_seconds is not None else None
+    encoded = json.dumps(value)
+    updated = db.execute(
+        update(models.AppState).where(models.AppState.key == key).values(value=encoded, expires_at=expires_at)
+    ).rowcount
+    if not updated:
+        db.add(models.AppState(key=key, value=encoded, expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker inserted the key first; the last write wins.
+        db.rollback()
+        return set_value(db, key, value, ttl_seconds)
+    cache.put(key, value, ttl_seconds)
+
+
+def add_value(db: Session, key: str, value):
+    """Stores value under key unless the key already has a row, and commits. Returns whether it was stored."""
+    db.add(models.AppState(key=key, value=json.dumps(value)))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    cache.put(key, value)
+    return True
+
+
+def compare_and_set(db: Session, key: str, expected, value):
+    """
+    Replaces the value of key with value only if it currently is expected,
+    atomically across workers. Returns whether it was replaced.
+    """
+    replaced = db.execute(
+        update(models.AppState)
+        .where(_live(key), models.AppState.value == json.dumps(expected))
+        .values(value=json.dumps(value))
+    ).rowcount == 1
+    db.commit()
+    cache.pop(key)
+    return replaced
+
+
+def is_setup_needed(db: Session):
+    return bool(get_value(db, SETUP_NEEDED, False))
+
+
+def set_setup_needed(db: Session, needed: bool):
+    set_value(db, SETUP_NEEDED, needed)
+
+
+def init_setup_needed(db: Session, users_exist: bool):
+    """
+    Run by every worker at startup. The flag is stored by the first worker
+    only; later ones can only clear it, so a worker starting while the
+    first admin is being created cannot reopen the setup.
+    """
+    if not add_value(db, SETUP_NEEDED, not users_exist) and users_exist:
+        claim_setup(db)
+
+
+def claim_setup(db: Session):
+    """Clears the setup flag if it is set. Only one caller across all workers gets True."""
+    return compare_and_set(db, SETUP_NEEDED, True, False)
+
+
+def add_oauth_state(db: Session, state: str):
+    """Records the state of an OAuth flow that was just started, for OAUTH_STATE_TTL_SECONDS."""
+    # Abandoned flows leave expired states behind; drop them while we are here.
+    db.execute(delete(models.AppState).where(
+        models.AppState.key.startswith(OAUTH_STATE_PREFIX), models.AppState.expires_at <= _utcnow()
+    ))
+    set_value(db, OAUTH_STATE_PREFIX + state, True, OAUTH_STATE_TTL_SECONDS)
+
+
+def consume_oauth_state(db: Session, state: str):
+    """Deletes the pending OAuth state. Returns False if it is unknown, expired or already used."""
+    key = OAUTH_STATE_PREFIX + state
+    consumed = db.execute(delete(models.AppState).where(_live(key))).rowcount == 1
+    db.commit()
+    cache.pop(key)
+    return consumed
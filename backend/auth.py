@@ -1,3 +1,8 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -9,7 +14,8 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 import crud
-from database import SessionLocal
+import user_cache
+from database import SessionLocal, get_db
 from models import UserInDB
 
 # to get a string like this run:
@@ -18,9 +24,21 @@ SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# PBKDF2 runs in hashlib, which releases the GIL, so a small thread pool hashes in parallel
+# without blocking the event loop. Requests beyond the queue limit are rejected right away.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_lock = threading.Lock()
+_hash_pending = 0
+
+class HashingBusyError(Exception):
+    """Raised when PASSWORD_HASH_MAX_QUEUE password operations are already pending."""
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -31,6 +49,33 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _release_hash_slot(future):
+    global _hash_pending
+    with _hash_lock:
+        _hash_pending -= 1
+
+def _submit_hash_job(function, *args):
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= PASSWORD_HASH_MAX_QUEUE:
+            raise HashingBusyError("Too many password operations in progress. Please try again shortly.")
+        _hash_pending += 1
+    future = _hash_executor.submit(function, *args)
+    future.add_done_callback(_release_hash_slot)
+    return future
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the hashing pool, for async endpoints."""
+    return await asyncio.wrap_future(_submit_hash_job(verify_password, plain_password, hashed_password))
+
+async def hash_password_async(password):
+    """get_password_hash on the hashing pool, subject to the same queue limit."""
+    return await asyncio.wrap_future(_submit_hash_job(get_password_hash, password))
+
+def hash_pool_stats():
+    with _hash_lock:
+        return {"workers": PASSWORD_HASH_WORKERS, "pending": _hash_pending, "max_queue": PASSWORD_HASH_MAX_QUEUE}
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -41,13 +86,6 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def get_user(db, username: str):
     return crud.get_user_by_username(db, username=username)
 
@@ -57,16 +95,26 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: SessionLocal = Dep
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    token_key = user_cache.token_key(token)
+    username = user_cache.tokens.get(token_key)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = get_user(db, username=username)
+        if "exp" in payload:
+            user_cache.tokens.put(token_key, username, ttl_seconds=payload["exp"] - time.time())
+
+    user = user_cache.users.get(username)
     if user is None:
-        raise credentials_exception
+        db_user = get_user(db, username=username)
+        if db_user is None:
+            raise credentials_exception
+        user = UserInDB.model_validate(db_user)
+        user_cache.users.put(username, user)
     return user
 
 def get_current_active_user(current_user: UserInDB = Depends(get_current_user)):
@@ -0,0 +1,252 @@
+"""
+Slot engine for the availability endpoint.
+
+This module has no FastAPI or Google dependencies: it takes a CompiledConfig,
+a date range, a timezone and the busy intervals already fetched from the
+calendar, and returns the free slots.
+"""
+import bisect
+import datetime
+import functools
+import heapq
+import itertools
+import os
+import time
+from datetime import timedelta
+
+import availability_batch
+import metrics
+import timezones
+
+# Estimated slot count above which the NumPy engine in availability_batch is used.
+BATCH_MIN_SLOTS = int(os.getenv("AVAILABILITY_BATCH_MIN_SLOTS", "2000"))
+
+
+class CompiledConfig:
+    """
+    AvailabilityConfig prepared for slot generation: the rule for each weekday
+    as a tuple of (start, end) work hours sorted by start time, the breaks
+    sorted the same way and the appointment duration as a timedelta.
+    """
+
+    def __init__(self, config, version: int = 0):
+        self.config = config
+        self.version = version
+        self.duration = timedelta(minutes=config.appointment_duration_minutes)
+        work_hours_by_weekday = [None] * 7
+        for rule in config.rules:
+            if 0 <= rule.day_of_week < 7 and work_hours_by_weekday[rule.day_of_week] is None:
+                work_hours_by_weekday[rule.day_of_week] = tuple(sorted(
+                    (work_hour_range.start, work_hour_range.end) for work_hour_range in rule.work_hours
+                )) if rule.is_available else ()
+        self.work_hours_by_weekday = tuple(work_hours or () for work_hours in work_hours_by_weekday)
+        self.breaks = tuple(sorted((break_range.start, break_range.end) for break_range in config.breaks or []))
+
+
+def merge_intervals(intervals):
+    """
+    Sorts (start, end) pairs and merges the ones that overlap or touch.
+    Empty and inverted intervals are dropped, since they can never overlap a slot.
+    """
+    merged = []
+    for start, end in sorted((start, end) for start, end in intervals if start < end):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class IntervalSweep:
+    """
+    Forward-only cursor over merged, sorted intervals.
+    Slots must be probed in increasing order between two calls to seek().
+    """
+
+    def __init__(self, intervals):
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.position = 0
+
+    def seek(self, moment):
+        """Moves the cursor to the first interval ending after the given moment."""
+        self.position = bisect.bisect_right(self.ends, moment)
+
+    def overlaps(self, start, end):
+        ends = self.ends
+        position = self.position
+        while position < len(ends) and ends[position] <= start:
+            position += 1
+        self.position = position
+        return position < len(ends) and self.starts[position] < end
+
+
+def normalize_busy_times(busy_times):
+    """Converts busy intervals to UTC and merges them into a sorted, disjoint list."""
+    utc = datetime.timezone.utc
+    return merge_intervals(
+        (busy['start'].astimezone(utc), busy['end'].astimezone(utc)) for busy in busy_times
+    )
+
+
+def iter_available_slots(compiled: CompiledConfig, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times):
+    """
+    Yields (slot_start, slot_end) pairs, localized in user_tz, for every slot
+    between start_date and end_date (inclusive) that falls inside the work hours
+    and does not overlap a break or a busy interval.
+    """
+    duration = compiled.duration
+    busy = IntervalSweep(normalize_busy_times(busy_times))
+
+    current_day = start_date
+    while current_day <= end_date:
+        work_hours = compiled.work_hours_by_weekday[current_day.weekday()]
+
+        if work_hours:
+            # A fixed offset for the whole day; None on the rare days with a DST transition.
+            day_tz = timezones.day_tzinfo(user_tz, current_day)
+            if day_tz is not None:
+                combine = functools.partial(datetime.datetime.combine, current_day, tzinfo=day_tz)
+            else:
+                combine = functools.partial(timezones.wall_time, user_tz, current_day)
+
+            breaks = IntervalSweep(merge_intervals(
+                (combine(break_start), combine(break_end)) for break_start, break_end in compiled.breaks
+            ))
+
+            for work_start, work_end in work_hours:
+                slot_start = combine(work_start)
+                slot_end = slot_start + duration
+                work_period_end = combine(work_end)
+                breaks.seek(slot_start)
+                busy.seek(slot_start)
+
+                while slot_end <= work_period_end:
+                    if not breaks.overlaps(slot_start, slot_end) and not busy.overlaps(slot_start, slot_end):
+                        if day_tz is not None:
+                            yield slot_start, slot_end
+                        else:
+                            yield slot_start.astimezone(user_tz), slot_end.astimezone(user_tz)
+                    slot_start = slot_end
+                    slot_end += duration
+
+        current_day += timedelta(days=1)
+
+
+def _tag_slots(name, slots):
+    for slot_start, slot_end in slots:
+        yield slot_start, slot_end, name
+
+
+def merge_resource_slots(slots_by_resource, require_all: bool):
+    """
+    k-way merge of the sorted slot streams of several resources, given as a
+    dict of resource name to (slot_start, slot_end) iterable. Yields
+    (slot_start, slot_end, names) with the resources free for each slot; with
+    require_all, only the slots every resource is free for.
+    """
+    merged = heapq.merge(*(_tag_slots(name, slots) for name, slots in slots_by_resource.items()))
+    for (slot_start, slot_end), group in itertools.groupby(merged, key=lambda slot: slot[:2]):
+        names = [name for _, _, name in group]
+        if not require_all or len(names) == len(slots_by_resource):
+            yield slot_start, slot_end, names
+
+
+def compute_team_slots(resources, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times_by_calendar, require_all: bool):
+    """
+    Slots for a pool of resources (config_cache.CompiledResource), each with
+    its own configuration and calendar: the slots at least one resource is
+    free for, or with require_all those every resource is free for.
+    """
+    started = time.perf_counter()
+    slots_by_resource = {
+        resource.name: iter_available_slots(
+            resource.compiled, start_date, end_date, user_tz, busy_times_by_calendar[resource.calendar_id]
+        )
+        for resource in resources
+    }
+    slots = [
+        {"start_time": slot_start.isoformat(), "end_time": slot_end.isoformat(), "resources": names}
+        for slot_start, slot_end, names in merge_resource_slots(slots_by_resource, require_all)
+    ]
+    metrics.record_slot_engine(
+        "team",
+        ((end_date - start_date).days + 1) * len(resources),
+        sum(len(busy_times_by_calendar[resource.calendar_id]) for resource in resources),
+        len(slots),
+        time.perf_counter() - started,
+    )
+    return slots
+
+
+def booking_error(compiled: CompiledConfig, start_time: datetime.datetime, end_time: datetime.datetime):
+    """
+    Checks a booking against the configuration, using the wall-clock time of
+    its own UTC offset. Returns why it is not bookable, or None.
+    """
+    if start_time.tzinfo is None or end_time.tzinfo is None:
+        return "Start and end times must include a UTC offset."
+    if end_time - start_time != compiled.duration:
+        return f"Appointments must last {compiled.config.appointment_duration_minutes} minutes."
+    end_time = end_time.astimezone(start_time.tzinfo)
+    # Work hours end within the day, so an appointment ending on the next day is never inside them.
+    start, end = start_time.time(), end_time.time()
+    work_hours = compiled.work_hours_by_weekday[start_time.weekday()]
+    if end_time.date() != start_time.date() or not any(
+        work_start <= start and end <= work_end for work_start, work_end in work_hours
+    ):
+        return "Outside of work hours."
+    if any(break_start < end and start < break_end for break_start, break_end in compiled.breaks):
+        return "Overlaps a break."
+    return None
+
+
+def first_available_slots(compiled: CompiledConfig, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times, not_before: datetime.datetime, count: int):
+    """Returns up to count of the earliest slots of the range starting at or after not_before."""
+    slots = (
+        slot for slot in iter_available_slots(compiled, start_date, end_date, user_tz, busy_times)
+        if slot[0] >= not_before
+    )
+    return [
+        {"start_time": slot_start.isoformat(), "end_time": slot_end.isoformat()}
+        for slot_start, slot_end in itertools.islice(slots, count)
+    ]
+
+
+def estimate_slot_count(compiled: CompiledConfig, start_date: datetime.date, end_date: datetime.date):
+    """Upper bound on the number of slots the range can produce, ignoring breaks and busy times."""
+    if end_date < start_date:
+        return 0
+    minutes_per_weekday = [
+        sum(max((end.hour * 60 + end.minute) - (start.hour * 60 + start.minute), 0) for start, end in work_hours)
+        for work_hours in compiled.work_hours_by_weekday
+    ]
+    total_days = (end_date - start_date).days + 1
+    minutes = 0
+    for offset in range(min(total_days, 7)):
+        weekday = (start_date + timedelta(days=offset)).weekday()
+        occurrences = (total_days - offset + 6) // 7
+        minutes += minutes_per_weekday[weekday] * occurrences
+    return minutes // max(compiled.duration // timedelta(minutes=1), 1)
+
+
+def compute_available_slots(compiled: CompiledConfig, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times):
+    """
+    Returns the free slots as the list of dicts served by /api/v1/availability.
+    Large ranges are handed to the vectorized engine when NumPy is installed.
+    """
+    started = time.perf_counter()
+    if availability_batch.is_available() and estimate_slot_count(compiled, start_date, end_date) >= BATCH_MIN_SLOTS:
+        engine = "batch"
+        slots = availability_batch.compute_available_slots(compiled, start_date, end_date, user_tz, busy_times)
+    else:
+        engine = "scalar"
+        slots = [
+            {"start_time": slot_start.isoformat(), "end_time": slot_end.isoformat()}
+            for slot_start, slot_end in iter_available_slots(compiled, start_date, end_date, user_tz, busy_times)
+        ]
+    metrics.record_slot_engine(
+        engine, (end_date - start_date).days + 1, len(busy_times), len(slots), time.perf_counter() - started
+    )
+    return slots
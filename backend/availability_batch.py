@@ -0,0 +1,134 @@
+"""
+NumPy implementation of the slot engine, used for long date ranges.
+
+Work hours, breaks and busy intervals are turned into int64 arrays of
+microseconds since the epoch; slot starts and overlap masks are computed with
+array operations and ISO strings are only built at the end. The result is the
+same list availability.compute_available_slots would return.
+
+Slots on the days with a DST transition, whose UTC offset is not the same
+for the whole day, are formatted one by one in Python.
+"""
+import datetime
+
+import timezones
+
+try:
+    import numpy as np
+except ImportError:  # The scalar engine is used when NumPy is not installed.
+    np = None
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def is_available():
+    return np is not None
+
+
+def _to_epoch_us(moment: datetime.datetime):
+    return (moment - EPOCH) // ONE_MICROSECOND
+
+
+def _local_isoformat(epoch_us: int, user_tz):
+    return (EPOCH + datetime.timedelta(microseconds=epoch_us)).astimezone(user_tz).isoformat()
+
+
+def _merge_blocked(starts, ends):
+    """Merges intervals given as two int64 arrays into sorted, disjoint ones."""
+    keep = starts < ends
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    # A new group starts wherever an interval begins after everything before it has ended.
+    is_new = np.empty(len(starts), dtype=bool)
+    is_new[0] = True
+    is_new[1:] = starts[1:] > reach[:-1]
+    group_starts = starts[is_new]
+    is_last = np.empty(len(starts), dtype=bool)
+    is_last[:-1] = is_new[1:]
+    is_last[-1] = True
+    group_ends = reach[is_last]
+    return group_starts, group_ends
+
+
+def _format(local_us, suffixes):
+    """Builds isoformat() strings from local wall-clock microseconds and UTC offset suffixes."""
+    local = local_us.astype("datetime64[us]")
+    text = np.datetime_as_string(local, unit="s")
+    has_micro = (local_us % 1_000_000) != 0
+    if has_micro.any():
+        text = np.where(has_micro, np.datetime_as_string(local, unit="us"), text)
+    return np.char.add(text.astype(str), suffixes)
+
+
+def compute_available_slots(compiled, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times):
+    """Vectorized equivalent of availability.compute_available_slots."""
+    duration_us = compiled.duration // ONE_MICROSECOND
+
+    range_starts, range_ends, range_offsets, range_suffixes, range_shifting = [], [], [], [], []
+    blocked_starts = [_to_epoch_us(busy['start']) for busy in busy_times]
+    blocked_ends = [_to_epoch_us(busy['end']) for busy in busy_times]
+
+    current_day = start_date
+    while current_day <= end_date:
+        work_hours = compiled.work_hours_by_weekday[current_day.weekday()]
+        if work_hours:
+            day_tz = timezones.day_tzinfo(user_tz, current_day)
+            for break_start, break_end in compiled.breaks:
+                blocked_starts.append(_to_epoch_us(timezones.wall_time(user_tz, current_day, break_start)))
+                blocked_ends.append(_to_epoch_us(timezones.wall_time(user_tz, current_day, break_end)))
+            for work_start, work_end in work_hours:
+                range_start = timezones.wall_time(user_tz, current_day, work_start)
+                range_end = timezones.wall_time(user_tz, current_day, work_end)
+                range_starts.append(_to_epoch_us(range_start))
+                range_ends.append(_to_epoch_us(range_end))
+                range_shifting.append(day_tz is None)
+                range_offsets.append(range_start.utcoffset() // ONE_MICROSECOND)
+                range_suffixes.append(range_start.isoformat()[len(range_start.replace(tzinfo=None).isoformat()):])
+        current_day += datetime.timedelta(days=1)
+
+    if not range_starts:
+        return []
+
+    range_starts = np.array(range_starts, dtype=np.int64)
+    range_ends = np.array(range_ends, dtype=np.int64)
+    counts = np.maximum((range_ends - range_starts) // duration_us, 0)
+    total = int(counts.sum())
+    if not total:
+        return []
+
+    # Index of each slot within its work-hour range, then the absolute slot bounds.
+    first_index = np.repeat(np.cumsum(counts) - counts, counts)
+    slot_index = np.arange(total, dtype=np.int64) - first_index
+    slot_starts = np.repeat(range_starts, counts) + slot_index * duration_us
+    slot_ends = slot_starts + duration_us
+
+    merged_starts, merged_ends = _merge_blocked(
+        np.array(blocked_starts, dtype=np.int64), np.array(blocked_ends, dtype=np.int64)
+    )
+    if len(merged_starts):
+        position = np.searchsorted(merged_ends, slot_starts, side="right")
+        clipped = np.minimum(position, len(merged_starts) - 1)
+        free = (position >= len(merged_starts)) | (merged_starts[clipped] >= slot_ends)
+    else:
+        free = np.ones(total, dtype=bool)
+
+    offsets = np.repeat(np.array(range_offsets, dtype=np.int64), counts)[free]
+    suffixes = np.repeat(np.array(range_suffixes), counts)[free]
+    start_strings = _format(slot_starts[free] + offsets, suffixes).tolist()
+    end_strings = _format(slot_ends[free] + offsets, suffixes).tolist()
+
+    shifting = np.repeat(np.array(range_shifting, dtype=bool), counts)[free]
+    if shifting.any():
+        free_starts, free_ends = slot_starts[free], slot_ends[free]
+        for index in np.flatnonzero(shifting).tolist():
+            start_strings[index] = _local_isoformat(int(free_starts[index]), user_tz)
+            end_strings[index] = _local_isoformat(int(free_ends[index]), user_tz)
+    return [
+        {"start_time": start_time, "end_time": end_time}
+        for start_time, end_time in zip(start_strings, end_strings)
+    ]
@@ -0,0 +1,220 @@
+"""
+Materialized availability: the free slots of each day of the primary
+calendar, per timezone, in the availability_days table.
+
+/api/v1/availability reads the requested days with one indexed range query.
+Days that are missing, or older than AVAILABILITY_STORE_MAX_AGE_SECONDS, are
+computed from the busy times of the missing span only and written back.
+
+Rows are deleted for the affected dates only:
+- when a booking is made, or the event mirror sees an event change
+  (invalidate_range),
+- when update_config changes the rules of some weekdays, the breaks or the
+  duration (invalidate_config_change), in the same transaction.
+Without the event mirror, changes made directly in Google Calendar show up
+when the refresh job recomputes the next AVAILABILITY_STORE_DAYS days, every
+AVAILABILITY_STORE_REFRESH_SECONDS, for every timezone present in the table.
+
+Booking ledger claims are not stored in the rows; they are subtracted when
+the rows are read, so an expired or released claim never sticks. Days with a
+booking confirmed shortly before or during the busy-times fetch are served
+but not stored: the fetch may predate the booking's event, and the claim
+only hides its slot for the ledger's confirmed hold.
+"""
+import datetime
+import os
+import threading
+
+from googleapiclient.errors import HttpError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import availability
+import booking_ledger
+import calendar_client
+import config_cache
+import crud
+import google_calendar
+import models
+import timezones
+from circuit_breaker import CalendarUnavailableError
+from google_calendar import PRIMARY_CALENDAR
+from database import SessionLocal
+
+AVAILABILITY_STORE_ENABLED = os.getenv("AVAILABILITY_STORE_ENABLED", "false").lower() in ("1", "true", "yes")
+AVAILABILITY_STORE_DAYS = int(os.getenv("AVAILABILITY_STORE_DAYS", "30"))
+AVAILABILITY_STORE_MAX_AGE_SECONDS = float(os.getenv("AVAILABILITY_STORE_MAX_AGE_SECONDS", "900"))
+AVAILABILITY_STORE_REFRESH_SECONDS = float(os.getenv("AVAILABILITY_STORE_REFRESH_SECONDS", "300"))
+
+
+def _days(start_date: datetime.date, end_date: datetime.date):
+    return [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def _rows(db: Session, time_zone: str, start_date: datetime.date, end_date: datetime.date, calendar_id: str = PRIMARY_CALENDAR):
+    return db.query(models.AvailabilityDay).filter(
+        models.AvailabilityDay.calendar_id == calendar_id,
+        models.AvailabilityDay.time_zone == time_zone,
+        models.AvailabilityDay.day >= start_date,
+        models.AvailabilityDay.day <= end_date,
+    )
+
+
+def get_days(db: Session, time_zone: str, start_date: datetime.date, end_date: datetime.date):
+    """Returns a dict of day to slots for the fresh rows in the range."""
+    fresh_after = datetime.datetime.utcnow() - datetime.timedelta(seconds=AVAILABILITY_STORE_MAX_AGE_SECONDS)
+    rows = _rows(db, time_zone, start_date, end_date).filter(models.AvailabilityDay.computed_at >= fresh_after)
+    return {row.day: row.slots for row in rows}
+
+
+def missing_span(days: dict, start_date: datetime.date, end_date: datetime.date):
+    """First and last day of the range that are not in days, or None if all are."""
+    missing = [day for day in _days(start_date, end_date) if day not in days]
+    return (missing[0], missing[-1]) if missing else None
+
+
+def compute_days(compiled: availability.CompiledConfig, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times):
+    """The slots of each day of the range as a dict of day to slots, without storing them."""
+    days = {day: [] for day in _days(start_date, end_date)}
+    for slot in availability.compute_available_slots(compiled, start_date, end_date, user_tz, busy_times):
+        days[datetime.date.fromisoformat(slot["start_time"][:10])].append(slot)
+    return days
+
+
+def compute_and_store(db: Session, compiled: availability.CompiledConfig, start_date: datetime.date, end_date: datetime.date, user_tz, busy_times, fetched_at: datetime.datetime):
+    """
+    Computes the slots of each day of the range from calendar busy times
+    (without ledger claims) requested at fetched_at (naive UTC), stores them
+    and returns them as a dict of day to slots.
+    When a concurrent request stores the same days first, its rows are kept
+    and the computed slots are only returned.
+    """
+    days = compute_days(compiled, start_date, end_date, user_tz, busy_times)
+
+    if booking_ledger.missed_by_fetch(db, fetched_at, *timezones.day_bounds(user_tz, start_date, end_date)):
+        db.rollback()
+        return days
+
+    now = datetime.datetime.utcnow()
+    _rows(db, user_tz.key, start_date, end_date).delete(synchronize_session=False)
+    db.add_all(
+        models.AvailabilityDay(
+            calendar_id=PRIMARY_CALENDAR, time_zone=user_tz.key, day=day, weekday=day.weekday(), slots=slots, computed_at=now
+        )
+        for day, slots in days.items()
+    )
+    try:
+        db.flush()
+        # Rows computed from a configuration that changed meanwhile must not be kept.
+        if crud.get_config_version(db) != compiled.version:
+            db.rollback()
+        else:
+            db.commit()
+    except IntegrityError:
+        db.rollback()
+    return days
+
+
+def without_claims(db: Session, slots, time_min: datetime.datetime, time_max: datetime.datetime):
+    """Drops the slots that overlap an active booking ledger claim."""
+    claimed = availability.normalize_busy_times(booking_ledger.get_busy_times(db, time_min, time_max))
+    if not claimed:
+        return slots
+    claims = availability.IntervalSweep(claimed)
+    available = []
+    for slot in slots:
+        slot_start = datetime.datetime.fromisoformat(slot["start_time"])
+        slot_end = datetime.datetime.fromisoformat(slot["end_time"])
+        claims.seek(slot_start)
+        if not claims.overlaps(slot_start, slot_end):
+            available.append(slot)
+    return available
+
+
+def invalidate_range(db: Session, start_time: datetime.datetime, end_time: datetime.datetime, calendar_id: str = PRIMARY_CALENDAR):
+    """
+    Deletes the rows of every day the interval may fall on, in any timezone,
+    as part of the caller's transaction.
+    """
+    start_day = start_time.astimezone(datetime.timezone.utc).date() - datetime.timedelta(days=1)
+    end_day = end_time.astimezone(datetime.timezone.utc).date() + datetime.timedelta(days=1)
+    db.query(models.AvailabilityDay).filter(
+        models.AvailabilityDay.calendar_id == calendar_id,
+        models.AvailabilityDay.day >= start_day,
+        models.AvailabilityDay.day <= end_day,
+    ).delete(synchronize_session=False)
+
+
+def invalidate_calendar(db: Session, calendar_id: str = PRIMARY_CALENDAR):
+    db.query(models.AvailabilityDay).filter(
+        models.AvailabilityDay.calendar_id == calendar_id
+    ).delete(synchronize_session=False)
+
+
+def invalidate_config_change(db: Session, old: availability.CompiledConfig, new: availability.CompiledConfig):
+    """
+    Deletes the rows of the weekdays whose slots may differ between the two
+    configurations, as part of the caller's transaction.
+    """
+    if old.duration != new.duration:
+        invalidate_calendar(db)
+        return
+    weekdays = {
+        weekday for weekday in range(7)
+        if old.work_hours_by_weekday[weekday] != new.work_hours_by_weekday[weekday]
+        # Breaks only matter on days with work hours.
+        or (old.breaks != new.breaks and (old.work_hours_by_weekday[weekday] or new.work_hours_by_weekday[weekday]))
+    }
+    if weekdays:
+        db.query(models.AvailabilityDay).filter(
+            models.AvailabilityDay.calendar_id == PRIMARY_CALENDAR,
+            models.AvailabilityDay.weekday.in_(weekdays),
+        ).delete(synchronize_session=False)
+
+
+def refresh(service, db: Session):
+    """Recomputes the next AVAILABILITY_STORE_DAYS days for every stored timezone."""
+    compiled = config_cache.get_compiled_config(db)
+    if not compiled:
+        return
+    time_zones = [row[0] for row in db.query(models.AvailabilityDay.time_zone).distinct()]
+    for time_zone in time_zones:
+        user_tz = timezones.get_timezone(time_zone)
+        start_date = datetime.datetime.now(user_tz).date()
+        end_date = start_date + datetime.timedelta(days=AVAILABILITY_STORE_DAYS - 1)
+        time_min, time_max = timezones.day_bounds(user_tz, start_date, end_date)
+        fetched_at = datetime.datetime.utcnow()
+        busy_times = calendar_client.calendar_busy_times(service, db, time_min, time_max, raise_errors=True)
+        compute_and_store(db, compiled, start_date, end_date, user_tz, busy_times, fetched_at)
+
+
+class RefreshJob:
+    """Background thread that keeps the store warm."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="availability-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            service = google_calendar.get_calendar_service()
+            if service is None:
+                continue
+            db = SessionLocal()
+            try:
+                refresh(service, db)
+            except (HttpError, CalendarUnavailableError) as error:
+                print(f"Availability store refresh failed: {error}")
+            finally:
+                db.close()
+
+
+refresh_job = RefreshJob(AVAILABILITY_STORE_REFRESH_SECONDS)
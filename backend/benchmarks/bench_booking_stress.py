@@ -0,0 +1,135 @@
+"""
+Concurrent booking stress test for the booking ledger.
+
+Fires many concurrent POST /api/v1/book requests at a handful of slots, some
+of them overlapping without sharing a start time, against a fake calendar
+service whose inserts are slow. Every slot must end up with exactly one
+Google event; the others must get 409. Uses a throwaway SQLite database in a
+temporary directory. Requires httpx.
+
+    cd backend && python benchmarks/bench_booking_stress.py --requests 200 --slots 5
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# The database path is resolved when the engine is created, so move first.
+os.chdir(tempfile.mkdtemp(prefix="bench-booking-"))
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import crud  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+
+DAY = datetime.datetime(2030, 1, 7, tzinfo=datetime.timezone.utc)
+
+
+class FakeRequest:
+    def __init__(self, execute):
+        self.execute = execute
+
+
+class FakeCalendarService:
+    """Records inserted events; each insert takes insert_seconds."""
+
+    def __init__(self, insert_seconds):
+        self.insert_seconds = insert_seconds
+        self.inserted = []
+        self._lock = threading.Lock()
+
+    def events(self):
+        return self
+
+    def insert(self, calendarId, body):
+        def execute():
+            time.sleep(self.insert_seconds)
+            with self._lock:
+                self.inserted.append(body)
+                return {"id": f"evt{len(self.inserted)}", **body}
+        return FakeRequest(execute)
+
+
+def booking_windows(slots):
+    """Hourly slots plus, for each, a window starting half an hour into it."""
+    windows = []
+    for index in range(slots):
+        start = DAY + datetime.timedelta(hours=9 + 2 * index)
+        windows.append((start, start + datetime.timedelta(hours=1)))
+        windows.append((start + datetime.timedelta(minutes=30), start + datetime.timedelta(minutes=90)))
+    return windows
+
+
+async def stress(requests, concurrency, windows):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def book(index):
+            start, end = windows[index % len(windows)]
+            async with semaphore:
+                response = await client.post("/api/v1/book", json={
+                    "start_time": start.isoformat(),
+                    "end_time": end.isoformat(),
+                    "user_details": {"name": f"client {index}"},
+                })
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(book(index) for index in range(requests)))
+        return statuses, time.perf_counter() - started
+
+
+def run(requests, concurrency, slots, insert_seconds):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        crud.create_config(db, models.AvailabilityConfig(rules=[
+            models.AvailabilityRule(day_of_week=day, work_hours=[models.TimeRange(start="00:00", end="23:59")])
+            for day in range(7)
+        ]))
+    finally:
+        db.close()
+
+    service = FakeCalendarService(insert_seconds)
+    main.app.dependency_overrides[api.get_calendar_service] = lambda: service
+    statuses, elapsed = asyncio.run(stress(requests, concurrency, booking_windows(slots)))
+
+    # Overlapping events in the fake calendar would be double bookings.
+    intervals = sorted(
+        (datetime.datetime.fromisoformat(event["start"]["dateTime"]), datetime.datetime.fromisoformat(event["end"]["dateTime"]))
+        for event in service.inserted
+    )
+    double_bookings = sum(1 for previous, current in zip(intervals, intervals[1:]) if current[0] < previous[1])
+    return {
+        "requests": requests,
+        "elapsed_seconds": elapsed,
+        "statuses": dict(collections.Counter(statuses)),
+        "events_created": len(service.inserted),
+        "slots": slots,
+        "double_bookings": double_bookings,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=5)
+    parser.add_argument("--insert-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+    results = run(args.requests, args.concurrency, args.slots, args.insert_seconds)
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if results["double_bookings"] else 0)
@@ -0,0 +1,86 @@
+"""
+Per-request overhead of obtaining a Google Calendar service.
+
+Compares the previous behaviour (read token.json, rebuild Credentials and
+call discovery.build on every request) with CalendarServiceHolder. Runs
+offline with a throwaway, non-expired token.json and SQLite database in a
+temporary directory; no Google calls are made.
+
+    cd backend && python benchmarks/bench_calendar_service.py --iterations 200
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+
+from sqlalchemy import create_engine  # noqa: E402
+
+import google_calendar  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+
+
+def write_fake_token(directory):
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    token = {
+        "token": "fake-access-token",
+        "refresh_token": "fake-refresh-token",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "fake-client-id.apps.googleusercontent.com",
+        "client_secret": "fake-client-secret",
+        "scopes": google_calendar.SCOPES,
+        "expiry": expiry.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+    }
+    with open(os.path.join(directory, google_calendar.TOKEN_FILE), "w") as token_file:
+        json.dump(token, token_file)
+
+
+def per_request_build():
+    """What every request did before the service holder existed."""
+    creds = Credentials.from_authorized_user_file(google_calendar.TOKEN_FILE, google_calendar.SCOPES)
+    return build('calendar', 'v3', credentials=creds)
+
+
+def measure(function, iterations):
+    function()  # warm-up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations
+
+
+def run(iterations):
+    with tempfile.TemporaryDirectory() as directory:
+        previous_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+            models.Base.metadata.create_all(bind=engine)
+            SessionLocal.configure(bind=engine)
+            write_fake_token(directory)
+            before = measure(per_request_build, iterations)
+            holder = google_calendar.CalendarServiceHolder()
+            after = measure(holder.get_service, iterations)
+        finally:
+            os.chdir(previous_directory)
+    return {
+        "iterations": iterations,
+        "per_request_build_ms": before * 1000,
+        "service_holder_ms": after * 1000,
+        "speedup": before / after if after else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.iterations), indent=2))
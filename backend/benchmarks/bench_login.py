@@ -0,0 +1,109 @@
+"""
+Login storm against unrelated endpoint latency.
+
+Fires concurrent POST /api/v1/token requests through the ASGI app while
+probing GET /api/v1/initial-setup, once with password verification inline on
+the event loop (the previous behaviour) and once on the hashing pool. Uses a
+throwaway SQLite database in a temporary directory. Requires httpx.
+
+    cd backend && python benchmarks/bench_login.py --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# The database path is resolved when the engine is created, so move first.
+os.chdir(tempfile.mkdtemp(prefix="bench-login-"))
+
+import httpx  # noqa: E402
+
+import auth  # noqa: E402
+import crud  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+async def verify_inline(plain_password, hashed_password):
+    return auth.verify_password(plain_password, hashed_password)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def storm(logins, concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/api/v1/token", data={"username": USERNAME, "password": PASSWORD})
+                assert response.status_code in (200, 503), response.text
+                return response.status_code
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/api/v1/initial-setup")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.005)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    return {
+        "logins_per_second": logins / elapsed,
+        "rejected": statuses.count(503),
+        "probe_p50_ms": statistics.median(probe_latencies) * 1000,
+        "probe_p95_ms": percentile(probe_latencies, 0.95) * 1000,
+        "probe_max_ms": max(probe_latencies) * 1000,
+        "probes": len(probe_latencies),
+    }
+
+
+def run(logins, concurrency):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if not crud.get_user_by_username(db, USERNAME):
+            crud.create_user(db, models.UserCreate(username=USERNAME, password=PASSWORD), auth.get_password_hash(PASSWORD))
+    finally:
+        db.close()
+
+    pooled = auth.verify_password_async
+    results = {}
+    try:
+        auth.verify_password_async = verify_inline
+        results["inline"] = asyncio.run(storm(logins, concurrency))
+    finally:
+        auth.verify_password_async = pooled
+    results["hash_pool"] = asyncio.run(storm(logins, concurrency))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.logins, args.concurrency), indent=2))
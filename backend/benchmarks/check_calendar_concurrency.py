@@ -0,0 +1,197 @@
+"""
+Concurrency check for the Google Calendar path of /api/v1/availability.
+
+Runs against the fake calendar service with a slow round trip
+(--latency-ms) and a cold free/busy cache:
+- coalescing: many identical requests, then many requests for sub-windows of
+  an in-flight one, must each cost a single free/busy query,
+- bounded executor: more concurrent requests for distinct days than
+  GOOGLE_MAX_PENDING allows; at most GOOGLE_MAX_CONCURRENCY Google calls may
+  run at once, and the excess must get a fast 503 instead of queueing.
+Throughout, a probe keeps calling GET /api/v1/initial-setup, a sync endpoint
+on the default threadpool; its p95 latency must stay under half the Google
+round trip, i.e. slow Google calls must not hold up the rest of the API.
+
+Prints the results as JSON and exits with 1 if a check fails. Uses a
+throwaway SQLite database in a temporary directory. Requires httpx.
+
+    cd backend && python benchmarks/check_calendar_concurrency.py --requests 50 --latency-ms 300
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# The database path is resolved when the engine is created, so move first.
+os.chdir(tempfile.mkdtemp(prefix="check-concurrency-"))
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import config_cache  # noqa: E402
+import crud  # noqa: E402
+import freebusy_cache  # noqa: E402
+import freebusy_coalescer  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+from calendar_client import client as calendar_client  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from fake_calendar import FakeCalendarService  # noqa: E402
+
+# A Monday, far enough ahead that no slot is ever in the past.
+START_DATE = datetime.date(2030, 1, 7)
+
+
+class CountingCalendarService(FakeCalendarService):
+    """Counts the free/busy queries that reach the fake Google."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.freebusy_queries = 0
+
+    def query(self, body):
+        self.freebusy_queries += 1
+        return super().query(body)
+
+
+def availability_params(start_offset: int, days: int):
+    start_date = START_DATE + datetime.timedelta(days=start_offset)
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": (start_date + datetime.timedelta(days=days - 1)).isoformat(),
+        "timezone": "UTC",
+    }
+
+
+async def get_availability(client, params):
+    started = time.perf_counter()
+    response = await client.get("/api/v1/availability", params=params)
+    return response.status_code, time.perf_counter() - started
+
+
+async def probe(client, latencies, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/v1/initial-setup")
+        assert response.status_code == 200, response.text
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def scenarios(client, service, requests, latency_seconds):
+    results = {}
+
+    freebusy_cache.cache.clear()
+    before = service.freebusy_queries
+    statuses = await asyncio.gather(*(get_availability(client, availability_params(0, 30)) for _ in range(requests)))
+    results["identical"] = {
+        "statuses": dict(collections.Counter(status for status, _ in statuses)),
+        "freebusy_queries": service.freebusy_queries - before,
+    }
+
+    freebusy_cache.cache.clear()
+    before = service.freebusy_queries
+    outer = asyncio.ensure_future(get_availability(client, availability_params(0, 30)))
+    await asyncio.sleep(latency_seconds / 5)
+    statuses = await asyncio.gather(outer, *(
+        get_availability(client, availability_params(index % 23, 7)) for index in range(requests)
+    ))
+    results["sub_windows"] = {
+        "statuses": dict(collections.Counter(status for status, _ in statuses)),
+        "freebusy_queries": service.freebusy_queries - before,
+    }
+
+    freebusy_cache.cache.clear()
+    service.max_in_flight = 0
+    distinct = calendar_client.max_pending * 2
+    statuses = await asyncio.gather(*(get_availability(client, availability_params(index, 1)) for index in range(distinct)))
+    rejected = [elapsed for status, elapsed in statuses if status == 503]
+    results["bounded"] = {
+        "requests": distinct,
+        "statuses": dict(collections.Counter(status for status, _ in statuses)),
+        "max_in_flight": service.max_in_flight,
+        "max_concurrency": calendar_client.max_concurrency,
+        "max_pending": calendar_client.max_pending,
+        "slowest_rejection_ms": max(rejected) * 1000 if rejected else None,
+    }
+    return results
+
+
+async def run_checks(service, requests, latency_seconds):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+        latencies = []
+        stop = asyncio.Event()
+        probing = asyncio.ensure_future(probe(client, latencies, stop))
+        try:
+            results = await scenarios(client, service, requests, latency_seconds)
+        finally:
+            stop.set()
+            await probing
+    results["probe"] = {
+        "requests": len(latencies),
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+    return results
+
+
+def failures(results, requests, latency_seconds):
+    bounded = results["bounded"]
+    checks = {
+        "identical requests share one free/busy query": results["identical"]["freebusy_queries"] == 1,
+        "identical requests all succeed": results["identical"]["statuses"] == {200: requests},
+        "sub-window requests share the outer query": results["sub_windows"]["freebusy_queries"] == 1,
+        "sub-window requests all succeed": results["sub_windows"]["statuses"] == {200: requests + 1},
+        "Google calls in flight stay within GOOGLE_MAX_CONCURRENCY": bounded["max_in_flight"] <= bounded["max_concurrency"],
+        "requests over GOOGLE_MAX_PENDING are rejected": bounded["statuses"].get(503, 0) > 0,
+        "requests under GOOGLE_MAX_PENDING succeed": bounded["statuses"].get(200, 0) >= bounded["max_pending"],
+        "rejections are immediate": (bounded["slowest_rejection_ms"] or 0) < latency_seconds * 1000 / 2,
+        "the rest of the API stays responsive": results["probe"]["p95_ms"] < latency_seconds * 1000 / 2,
+    }
+    return [name for name, passed in checks.items() if not passed]
+
+
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        crud.create_config(db, models.AvailabilityConfig(rules=[
+            models.AvailabilityRule(day_of_week=day, work_hours=[models.TimeRange(start="09:00", end="17:00")])
+            for day in range(7)
+        ]))
+    finally:
+        db.close()
+    config_cache.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="simulated Google round trip")
+    args = parser.parse_args()
+
+    setup_database()
+    latency_seconds = args.latency_ms / 1000
+    service = CountingCalendarService(busy_density=0.3, latency_seconds=latency_seconds)
+    main.app.dependency_overrides[api.get_calendar_service] = lambda: service
+    results = asyncio.run(run_checks(service, args.requests, latency_seconds))
+    results["coalescing"] = freebusy_coalescer.coalescer.stats()
+    failed = failures(results, args.requests, latency_seconds)
+    results["failed"] = failed
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,132 @@
+"""
+Checks event_mirror.sync against the fake calendar service.
+
+With a page size of 2, runs a full sync, then incremental syncs whose changes
+(new, moved and cancelled events) span several pages ending in a
+nextSyncToken, then an incremental sync with an expired token, which must fall
+back to a full sync on the 410. After each sync the mirror must hold exactly
+the fake calendar's events, and a booking whose event was cancelled must be
+gone from the booking ledger. Uses a throwaway SQLite database in a temporary
+directory and exits with 1 on the first mismatch.
+
+    cd backend && python benchmarks/check_event_mirror.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# The database path is resolved when the engine is created, so move first.
+os.chdir(tempfile.mkdtemp(prefix="check-mirror-"))
+
+import booking_ledger  # noqa: E402
+import event_mirror  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from fake_calendar import FakeCalendarService  # noqa: E402
+
+UTC = datetime.timezone.utc
+DAY = datetime.datetime(2030, 1, 7, tzinfo=UTC)
+PAGE_SIZE = 2
+WINDOW = (DAY - datetime.timedelta(days=1), DAY + datetime.timedelta(days=30))
+
+
+class RecordingCalendarService(FakeCalendarService):
+    """Remembers the parameters of every events().list call."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.list_calls = []
+
+    def list(self, calendarId, **params):
+        self.list_calls.append(params)
+        return super().list(calendarId, **params)
+
+
+def event_body(hour: int, day: int = 0):
+    start = DAY + datetime.timedelta(days=day, hours=hour)
+    return {
+        'summary': f"event at {start.isoformat()}",
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + datetime.timedelta(hours=1)).isoformat()},
+    }
+
+
+def insert(service, hour: int, day: int = 0):
+    return service.events().insert(calendarId='primary', body=event_body(hour, day)).execute()['id']
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        sys.exit(1)
+    print(f"ok: {message}")
+
+
+def check_mirror(service, db, step):
+    mirrored = {event['id']: (event['start'], event['end']) for event in event_mirror.get_events(db, *WINDOW)}
+    expected = {event['id']: (event['start'], event['end']) for event in service._live_events(*WINDOW)}
+    check(mirrored == expected, f"{step}: the mirror holds the calendar's {len(expected)} events")
+
+
+def sync(service, db):
+    service.list_calls.clear()
+    event_mirror.sync(service, db)
+    return list(service.list_calls)
+
+
+def run():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    service = RecordingCalendarService(page_size=PAGE_SIZE)
+    try:
+        for hour in range(9, 14):
+            insert(service, hour)
+        calls = sync(service, db)
+        check(len(calls) == 3 and all('timeMin' in params for params in calls), "full sync followed 3 pages")
+        check(db.get(models.CalendarSyncState, 'primary').sync_token is not None, "full sync stored the nextSyncToken")
+        check_mirror(service, db, "full sync")
+
+        booked = insert(service, 15)
+        booking_id = booking_ledger.claim(db, DAY + datetime.timedelta(hours=15), DAY + datetime.timedelta(hours=16))
+        booking_ledger.confirm(db, booking_id, booked)
+        new_ids = [insert(service, hour, day=1) for hour in (9, 10, 11)]
+        moved = next(iter(service.events_by_id))
+        service.update_event(moved, **{key: value for key, value in event_body(17, day=2).items() if key != 'summary'})
+        service.cancel_event(new_ids[1])
+        calls = sync(service, db)
+        check(
+            len(calls) == 3 and all('syncToken' in params and 'timeMin' not in params for params in calls),
+            "incremental sync of 6 changes followed 3 pages with the sync token",
+        )
+        check_mirror(service, db, "incremental sync")
+
+        service.cancel_event(booked)
+        calls = sync(service, db)
+        check(len(calls) == 1 and 'syncToken' in calls[0], "incremental sync of 1 change took 1 page")
+        check_mirror(service, db, "cancellation")
+        check(db.get(models.Booking, booking_id) is None, "the cancelled event's booking left the ledger")
+
+        service.expire_sync_tokens()
+        service.cancel_event(new_ids[0])
+        insert(service, 12, day=3)
+        calls = sync(service, db)
+        check(
+            'syncToken' in calls[0] and calls[1:] and all('timeMin' in params for params in calls[1:]),
+            "an expired sync token fell back to a full sync",
+        )
+        check_mirror(service, db, "full sync after 410")
+
+        calls = sync(service, db)
+        check(len(calls) == 1 and 'syncToken' in calls[0], "the new sync token is accepted")
+        check_mirror(service, db, "incremental sync after 410")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,179 @@
+"""
+Checks the DST handling of timezones.py against known transitions.
+
+In America/New_York, Europe/London, Australia/Lord_Howe (whose clocks move by
+30 minutes) and America/Santiago (whose transitions happen at midnight):
+- wall_time puts a wall time inside a gap past the gap, and one inside a
+  fold on its first occurrence, at the expected UTC instants,
+- day_bounds covers exactly the local days around the transitions,
+- day_tzinfo has no fixed offset for transition days, and on every day of
+  2024-2031 the cached fixed offset gives the same instants as zoneinfo,
+- the slots of a New York gap day and fold day last exactly the duration,
+  with the scalar and, when NumPy is installed, the vectorized engine.
+Exits with 1 on the first mismatch.
+
+    cd backend && python benchmarks/check_timezones.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# availability imports the models, whose engine points at ./sql_app.db.
+os.chdir(tempfile.mkdtemp(prefix="check-timezones-"))
+
+import availability  # noqa: E402
+import availability_batch  # noqa: E402
+import models  # noqa: E402
+import timezones  # noqa: E402
+
+UTC = datetime.timezone.utc
+D = datetime.date
+T = datetime.time
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+
+# (zone, local day, wall time, expected instant, what the wall time falls in)
+WALL_TIMES = [
+    ("America/New_York", D(2030, 3, 10), T(2, 30), utc(2030, 3, 10, 7, 30), "gap"),
+    ("America/New_York", D(2030, 11, 3), T(1, 30), utc(2030, 11, 3, 5, 30), "fold"),
+    ("America/New_York", D(2030, 3, 11), T(9, 0), utc(2030, 3, 11, 13, 0), "plain day"),
+    ("Europe/London", D(2030, 3, 31), T(1, 30), utc(2030, 3, 31, 1, 30), "gap"),
+    ("Europe/London", D(2030, 10, 27), T(1, 30), utc(2030, 10, 27, 0, 30), "fold"),
+    ("Australia/Lord_Howe", D(2030, 10, 6), T(2, 15), utc(2030, 10, 5, 15, 45), "30 minute gap"),
+    ("Australia/Lord_Howe", D(2030, 4, 7), T(1, 45), utc(2030, 4, 6, 14, 45), "30 minute fold"),
+    ("Australia/Lord_Howe", D(2030, 4, 8), T(9, 0), utc(2030, 4, 7, 22, 30), "plain day"),
+    ("America/Santiago", D(2024, 9, 8), T(0, 0), utc(2024, 9, 8, 4, 0), "gap at midnight"),
+    ("America/Santiago", D(2024, 9, 8), T(0, 30), utc(2024, 9, 8, 4, 30), "gap at midnight"),
+    ("America/Santiago", D(2024, 4, 6), T(23, 30), utc(2024, 4, 7, 2, 30), "fold before midnight"),
+]
+
+# (zone, first day, last day, expected first instant, expected last instant)
+DAY_BOUNDS = [
+    ("America/New_York", D(2030, 3, 10), D(2030, 3, 10), utc(2030, 3, 10, 5), utc(2030, 3, 11, 4) - ONE_MICROSECOND),
+    ("America/New_York", D(2030, 11, 2), D(2030, 11, 3), utc(2030, 11, 2, 4), utc(2030, 11, 4, 5) - ONE_MICROSECOND),
+    ("Europe/London", D(2030, 3, 31), D(2030, 3, 31), utc(2030, 3, 31, 0), utc(2030, 3, 31, 23) - ONE_MICROSECOND),
+    ("Europe/London", D(2030, 10, 27), D(2030, 10, 27), utc(2030, 10, 26, 23), utc(2030, 10, 28, 0) - ONE_MICROSECOND),
+    ("Australia/Lord_Howe", D(2030, 10, 6), D(2030, 10, 6), utc(2030, 10, 5, 13, 30), utc(2030, 10, 6, 13) - ONE_MICROSECOND),
+    ("Australia/Lord_Howe", D(2030, 4, 7), D(2030, 4, 7), utc(2030, 4, 6, 13), utc(2030, 4, 7, 13, 30) - ONE_MICROSECOND),
+    # Midnight is skipped, so the day starts at 01:00 -03.
+    ("America/Santiago", D(2024, 9, 8), D(2024, 9, 8), utc(2024, 9, 8, 4), utc(2024, 9, 9, 3) - ONE_MICROSECOND),
+    # The last hour is repeated; the bound is its first occurrence.
+    ("America/Santiago", D(2024, 4, 6), D(2024, 4, 6), utc(2024, 4, 6, 3), utc(2024, 4, 7, 3) - ONE_MICROSECOND),
+]
+
+# Days whose UTC offset changes during the day or at one of its midnights.
+TRANSITION_DAYS = [
+    ("America/New_York", D(2030, 3, 10)), ("America/New_York", D(2030, 11, 3)),
+    ("Europe/London", D(2030, 3, 31)), ("Europe/London", D(2030, 10, 27)),
+    ("Australia/Lord_Howe", D(2030, 4, 7)), ("Australia/Lord_Howe", D(2030, 10, 6)),
+    ("America/Santiago", D(2024, 9, 7)), ("America/Santiago", D(2024, 9, 8)),
+    ("America/Santiago", D(2024, 4, 6)),
+]
+
+SWEEP_YEARS = range(2024, 2032)
+SWEEP_STEP = datetime.timedelta(minutes=30)
+
+# 01:00-04:00 in one hour slots, on the New York transition days.
+SLOTS = [
+    (D(2030, 3, 10), [
+        ("2030-03-10T01:00:00-05:00", "2030-03-10T03:00:00-04:00"),
+        ("2030-03-10T03:00:00-04:00", "2030-03-10T04:00:00-04:00"),
+    ]),
+    (D(2030, 11, 3), [
+        ("2030-11-03T01:00:00-04:00", "2030-11-03T01:00:00-05:00"),
+        ("2030-11-03T01:00:00-05:00", "2030-11-03T02:00:00-05:00"),
+        ("2030-11-03T02:00:00-05:00", "2030-11-03T03:00:00-05:00"),
+        ("2030-11-03T03:00:00-05:00", "2030-11-03T04:00:00-05:00"),
+    ]),
+]
+
+
+def check(condition, message, got=None):
+    if not condition:
+        print(f"FAIL: {message}" + (f", got {got}" if got is not None else ""))
+        sys.exit(1)
+    print(f"ok: {message}")
+
+
+def check_wall_times():
+    for name, day, time, expected, kind in WALL_TIMES:
+        instant = timezones.wall_time(timezones.get_timezone(name), day, time)
+        check(instant == expected, f"{name} {day} {time} ({kind}) is {expected.isoformat()}", instant.isoformat())
+
+
+def check_day_bounds():
+    for name, start_date, end_date, expected_start, expected_end in DAY_BOUNDS:
+        start, end = timezones.day_bounds(timezones.get_timezone(name), start_date, end_date)
+        # Aware datetimes in a fold never compare equal across zones, so compare in UTC.
+        start, end = start.astimezone(UTC), end.astimezone(UTC)
+        check(
+            (start, end) == (expected_start, expected_end),
+            f"{name} {start_date}..{end_date} spans {expected_start.isoformat()} to {expected_end.isoformat()}",
+            f"{start.isoformat()} to {end.isoformat()}",
+        )
+
+
+def check_day_tzinfo():
+    for name, day in TRANSITION_DAYS:
+        check(timezones.day_tzinfo(timezones.get_timezone(name), day) is None, f"{name} {day} has no fixed offset")
+
+    for name in sorted({name for name, *_ in WALL_TIMES}):
+        tz = timezones.get_timezone(name)
+        day, last_day = D(SWEEP_YEARS.start, 1, 1), D(SWEEP_YEARS.stop - 1, 12, 31)
+        mismatches = []
+        while day <= last_day and len(mismatches) < 5:
+            moment = datetime.datetime.combine(day, T.min)
+            while moment.date() == day:
+                expected = moment.replace(tzinfo=tz).astimezone(UTC)
+                if timezones.wall_time(tz, day, moment.time()) != expected:
+                    mismatches.append(moment.isoformat())
+                moment += SWEEP_STEP
+            day += timezones.ONE_DAY
+        check(
+            not mismatches,
+            f"{name}: every {SWEEP_STEP // datetime.timedelta(minutes=1)} minutes of {SWEEP_YEARS.start}-{SWEEP_YEARS.stop - 1} agrees with zoneinfo",
+            f"mismatches at {mismatches}",
+        )
+
+    tz = timezones.get_timezone("Australia/Lord_Howe")
+    first = timezones.day_tzinfo(tz, D(2030, 6, 1))
+    hits = timezones.day_tzinfo.cache_info().hits
+    second = timezones.day_tzinfo(tz, D(2030, 6, 1))
+    check(
+        first is second and first.utcoffset(None) == datetime.timedelta(hours=10, minutes=30)
+        and timezones.day_tzinfo.cache_info().hits == hits + 1,
+        "day_tzinfo serves a repeated day from its cache",
+    )
+
+
+def check_slots():
+    compiled = availability.CompiledConfig(models.AvailabilityConfig(
+        rules=[
+            models.AvailabilityRule(day_of_week=day, work_hours=[models.TimeRange(start="01:00", end="04:00")])
+            for day in range(7)
+        ],
+        appointment_duration_minutes=60,
+    ))
+    tz = timezones.get_timezone("America/New_York")
+    engines = {"scalar": availability.compute_available_slots}
+    if availability_batch.is_available():
+        engines["vectorized"] = availability_batch.compute_available_slots
+    for engine, compute in engines.items():
+        for day, expected in SLOTS:
+            slots = [(slot["start_time"], slot["end_time"]) for slot in compute(compiled, day, day, tz, [])]
+            check(slots == expected, f"{engine} engine: {day} has {len(expected)} one hour slots from 01:00 to 04:00", slots)
+
+
+if __name__ == "__main__":
+    check_wall_times()
+    check_day_bounds()
+    check_day_tzinfo()
+    check_slots()
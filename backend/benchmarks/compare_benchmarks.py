@@ -0,0 +1,75 @@
+"""
+Compares two run_benchmarks.py result files and flags regressions.
+
+A benchmark regresses when its median latency grows, or its throughput
+drops, by more than --threshold (a fraction of the baseline value). Medians
+below --min-ms are ignored, since their noise exceeds any real change.
+Benchmarks present in only one file are listed but never fail the check.
+Exits with status 1 when anything regressed.
+
+    cd backend && python benchmarks/compare_benchmarks.py baseline.json current.json --threshold 0.2
+"""
+import argparse
+import json
+import sys
+
+# Metric name -> True when a higher value is better.
+COMPARED_METRICS = {
+    "median_ms": False,
+    "requests_per_second": True,
+}
+
+
+def compare(baseline, current, threshold, min_ms):
+    """Returns (rows, regressions); each row is (benchmark, metric, baseline, current, change, regressed)."""
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in baseline[name] or metric not in current[name]:
+                continue
+            before = baseline[name][metric]
+            after = current[name][metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            regressed = worse > threshold and not (metric.endswith("_ms") and max(before, after) < min_ms)
+            row = (name, metric, before, after, change, regressed)
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
+
+
+def load(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (default: 0.2)")
+    parser.add_argument("--min-ms", type=float, default=0.05, help="ignore latencies below this (default: 0.05)")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+    rows, regressions = compare(baseline["benchmarks"], current["benchmarks"], args.threshold, args.min_ms)
+
+    print(f"baseline: {baseline['meta'].get('git_revision')} {baseline['meta'].get('created_at')}")
+    print(f"current:  {current['meta'].get('git_revision')} {current['meta'].get('created_at')}")
+    if baseline["meta"].get("parameters") != current["meta"].get("parameters"):
+        print("warning: the two runs used different parameters")
+    for name, metric, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<55} {metric:<20} {before:12.3f} -> {after:12.3f} {change:+8.1%} {flag}")
+    for name in sorted(set(baseline["benchmarks"]) ^ set(current["benchmarks"])):
+        print(f"{name:<55} only in {'baseline' if name in baseline['benchmarks'] else 'current'}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+    print("No regressions.")
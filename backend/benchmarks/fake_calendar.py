@@ -0,0 +1,203 @@
+"""
+Offline stand-in for the Google Calendar service used by the benchmarks.
+
+Busy time is generated rather than stored: the timeline of every calendar is
+cut into blocks of block_minutes, and each block is busy with probability
+busy_density, decided by a hash of (seed, calendar, block). The same block is
+therefore busy in every query that covers it, whatever the query range, so
+cached and uncached paths see the same calendar. Events inserted through the
+service are added to the busy time of the primary calendar.
+
+Implements what the backend calls: freebusy().query, events().insert,
+events().list and new_batch_http_request. Every execute() sleeps for
+latency_seconds to stand in for the network round trip; in_flight and
+max_in_flight count the calls executing at once.
+
+events().list behaves like Google's for the event mirror: results come in
+pages of page_size events (one page by default) linked by nextPageToken, and
+the last page carries a nextSyncToken. Listing with that syncToken returns
+the events changed since, cancelled ones as {'id', 'status': 'cancelled'}.
+update_event() and cancel_event() change events as if done in Google
+Calendar, and after expire_sync_tokens() older tokens get 410 Gone.
+"""
+import datetime
+import hashlib
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+UTC = datetime.timezone.utc
+EPOCH = datetime.datetime(2000, 1, 1, tzinfo=UTC)
+
+
+class FakeRequest:
+    def __init__(self, execute):
+        self._execute = execute
+
+    def execute(self):
+        return self._execute()
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        # The parts share the round trip of the batch itself.
+        return self.service._request(self._execute_all).execute()
+
+    def _execute_all(self):
+        for request_id, request in self.requests:
+            self.callback(request_id, request._execute(), None)
+
+
+class FakeCalendarService:
+    def __init__(self, busy_density: float = 0.3, block_minutes: int = 30, seed: int = 0, latency_seconds: float = 0.0, page_size: int = None):
+        self.busy_density = busy_density
+        self.block = datetime.timedelta(minutes=block_minutes)
+        self.seed = seed
+        self.latency_seconds = latency_seconds
+        self.page_size = page_size
+        self.events_by_id = {}
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._changes = []  # event ids, in the order they were changed
+        self._token_generation = 0
+        self._lock = threading.Lock()
+
+    def _request(self, function, *args):
+        def execute():
+            with self._lock:
+                self.calls += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                if self.latency_seconds:
+                    time.sleep(self.latency_seconds)
+                return function(*args)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        return FakeRequest(execute)
+
+    def _is_busy(self, calendar_id: str, block_index: int):
+        key = f"{self.seed}:{calendar_id}:{block_index}".encode()
+        # Unlike a linear checksum such as CRC32, blake2b leaves blocks and calendars uncorrelated.
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') < self.busy_density * 2 ** 64
+
+    def busy_intervals(self, calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+        """Busy intervals overlapping the range, as aware UTC {'start', 'end'} dicts."""
+        first = (start_time.astimezone(UTC) - EPOCH) // self.block
+        last = (end_time.astimezone(UTC) - EPOCH) // self.block
+        intervals = []
+        for block_index in range(first, last + 1):
+            if not self._is_busy(calendar_id, block_index):
+                continue
+            block_start = EPOCH + block_index * self.block
+            if intervals and intervals[-1]['end'] == block_start:
+                intervals[-1]['end'] = block_start + self.block
+            else:
+                intervals.append({'start': block_start, 'end': block_start + self.block})
+        if calendar_id == 'primary':
+            for event in self._live_events(start_time, end_time):
+                intervals.append({'start': _event_time(event, 'start'), 'end': _event_time(event, 'end')})
+        return intervals
+
+    def _live_events(self, start_time: datetime.datetime = None, end_time: datetime.datetime = None):
+        with self._lock:
+            events = [event for event in self.events_by_id.values() if event['status'] != 'cancelled']
+        return [
+            event for event in events
+            if (end_time is None or _event_time(event, 'start') < end_time)
+            and (start_time is None or _event_time(event, 'end') > start_time)
+        ]
+
+    def freebusy(self):
+        return self
+
+    def query(self, body):
+        return self._request(self._query, body)
+
+    def _query(self, body):
+        start_time = datetime.datetime.fromisoformat(body['timeMin'])
+        end_time = datetime.datetime.fromisoformat(body['timeMax'])
+        return {'calendars': {
+            item['id']: {'busy': [
+                {'start': interval['start'].isoformat(), 'end': interval['end'].isoformat()}
+                for interval in self.busy_intervals(item['id'], start_time, end_time)
+            ]}
+            for item in body['items']
+        }}
+
+    def events(self):
+        return self
+
+    def insert(self, calendarId, body):
+        return self._request(self._insert, body)
+
+    def _insert(self, body):
+        with self._lock:
+            event = {'id': f"evt{len(self.events_by_id) + 1}", 'status': 'confirmed', **body}
+            self._changed(event)
+            return event
+
+    def _changed(self, event: dict):
+        self.events_by_id[event['id']] = event
+        self._changes.append(event['id'])
+
+    def update_event(self, event_id: str, **fields):
+        """Changes an event as if edited in Google Calendar, e.g. update_event(id, start=..., end=...)."""
+        with self._lock:
+            self._changed({**self.events_by_id[event_id], **fields})
+
+    def cancel_event(self, event_id: str):
+        """Deletes an event as if done in Google Calendar."""
+        with self._lock:
+            self._changed({'id': event_id, 'status': 'cancelled'})
+
+    def expire_sync_tokens(self):
+        """Makes every sync token handed out so far answer 410 Gone."""
+        with self._lock:
+            self._token_generation += 1
+
+    def list(self, calendarId, timeMin=None, timeMax=None, syncToken=None, pageToken=None, maxResults=None, **kwargs):
+        return self._request(self._list, timeMin, timeMax, syncToken, int(pageToken or 0), maxResults)
+
+    def _list(self, time_min, time_max, sync_token, offset, max_results):
+        with self._lock:
+            position = len(self._changes)
+            if sync_token is not None:
+                generation, since = map(int, sync_token.removeprefix('sync-').split('-'))
+                if generation != self._token_generation:
+                    raise HttpError(httplib2.Response({'status': 410}), b'{"error": {"code": 410, "message": "Sync token is no longer valid"}}')
+                changed = dict.fromkeys(self._changes[since:])
+                items = [self.events_by_id[event_id] for event_id in changed]
+        if sync_token is None:
+            items = self._live_events(
+                datetime.datetime.fromisoformat(time_min) if time_min else None,
+                datetime.datetime.fromisoformat(time_max) if time_max else None,
+            )
+            items.sort(key=lambda event: _event_time(event, 'start'))
+        page_size = min(size for size in (self.page_size, max_results, len(items) or 1) if size)
+        page = {'items': items[offset:offset + page_size], 'timeZone': 'UTC'}
+        if offset + page_size < len(items):
+            page['nextPageToken'] = str(offset + page_size)
+        else:
+            page['nextSyncToken'] = f"sync-{self._token_generation}-{position}"
+        return page
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+
+def _event_time(event: dict, key: str):
+    return datetime.datetime.fromisoformat(event[key]['dateTime']).astimezone(UTC)
@@ -0,0 +1,304 @@
+"""
+Benchmark suite for the scheduling hot paths.
+
+Measures, against the fake calendar in fake_calendar.py:
+- slot generation for each range size, timezone and busy density,
+- GET /api/v1/availability end to end through the ASGI app, with the
+  free/busy cache cold (cleared before each request) and warm, and warm
+  in the compact slot format,
+- POST /api/v1/book end to end,
+- login throughput under concurrency,
+- the overhead of an authenticated request (GET /api/v1/users/me) over an
+  unauthenticated one (GET /api/v1/initial-setup).
+
+Results are written as JSON; compare_benchmarks.py checks them against a
+baseline. Uses a throwaway SQLite database in a temporary directory and makes
+no Google calls. Requires httpx.
+
+    cd backend && python benchmarks/run_benchmarks.py --output baseline.json
+    cd backend && python benchmarks/run_benchmarks.py --quick --output current.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+INVOCATION_DIR = os.getcwd()
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# The database path is resolved when the engine is created, so move first.
+os.chdir(tempfile.mkdtemp(prefix="bench-suite-"))
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import auth  # noqa: E402
+import availability  # noqa: E402
+import config_cache  # noqa: E402
+import crud  # noqa: E402
+import freebusy_cache  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+import timezones  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from fake_calendar import FakeCalendarService  # noqa: E402
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+# A Monday, far enough ahead that no slot is ever in the past.
+START_DATE = datetime.date(2030, 1, 7)
+
+RANGE_DAYS = (1, 7, 30, 90, 365)
+TIME_ZONES = ("UTC", "America/Mexico_City", "Europe/Madrid", "Asia/Kolkata", "Australia/Lord_Howe")
+BUSY_DENSITIES = (0.1, 0.5)
+
+QUICK_RANGE_DAYS = (1, 30, 365)
+QUICK_TIME_ZONES = ("UTC", "Australia/Lord_Howe")
+QUICK_BUSY_DENSITIES = (0.5,)
+
+
+def bench_config():
+    return models.AvailabilityConfig(
+        rules=[
+            models.AvailabilityRule(day_of_week=day, is_available=day < 5, work_hours=[
+                models.TimeRange(start=datetime.time(8, 0), end=datetime.time(18, 0))
+            ] if day < 5 else [])
+            for day in range(7)
+        ],
+        breaks=[models.BreakRule(start=datetime.time(13, 0), end=datetime.time(14, 0))],
+        appointment_duration_minutes=30,
+    )
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(samples, **extra):
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "min_ms": min(samples) * 1000,
+        "iterations": len(samples),
+        **extra,
+    }
+
+
+def timed(function, iterations, warmup=2):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def timed_async(function, iterations, warmup=2):
+    for _ in range(warmup):
+        await function()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_slot_generation(range_days, time_zones, densities, iterations):
+    compiled = availability.CompiledConfig(bench_config())
+    results = {}
+    for density in densities:
+        service = FakeCalendarService(busy_density=density)
+        for days in range_days:
+            end_date = START_DATE + datetime.timedelta(days=days - 1)
+            for time_zone in time_zones:
+                user_tz = timezones.get_timezone(time_zone)
+                time_min, time_max = timezones.day_bounds(user_tz, START_DATE, end_date)
+                busy_times = service.busy_intervals('primary', time_min, time_max)
+                slots = availability.compute_available_slots(compiled, START_DATE, end_date, user_tz, busy_times)
+                # Fewer repetitions for the large ranges keep the suite's run time flat.
+                repeat = max(3, iterations * 7 // max(days, 7))
+                samples = timed(
+                    lambda: availability.compute_available_slots(compiled, START_DATE, end_date, user_tz, busy_times),
+                    repeat,
+                )
+                results[f"slots/{days}d/{time_zone}/density={density}"] = summarize(
+                    samples, slots=len(slots), busy_intervals=len(busy_times)
+                )
+    return results
+
+
+async def bench_endpoints(client, service, iterations, logins, concurrency):
+    results = {}
+
+    for days in (7, 30):
+        params = {
+            "start_date": START_DATE.isoformat(),
+            "end_date": (START_DATE + datetime.timedelta(days=days - 1)).isoformat(),
+            "timezone": "America/Mexico_City",
+        }
+
+        async def get_availability():
+            response = await client.get("/api/v1/availability", params=params)
+            assert response.status_code == 200, response.text
+
+        async def get_availability_cold():
+            freebusy_cache.cache.clear()
+            await get_availability()
+
+        async def get_availability_compact():
+            response = await client.get("/api/v1/availability", params={**params, "format": "compact"})
+            assert response.status_code == 200, response.text
+
+        results[f"availability/{days}d/cold"] = summarize(await timed_async(get_availability_cold, iterations))
+        results[f"availability/{days}d/warm"] = summarize(await timed_async(get_availability, iterations))
+        results[f"availability/{days}d/warm/compact"] = summarize(await timed_async(get_availability_compact, iterations))
+
+    # Every booking takes a new 30 minute slot that is free in the fake calendar,
+    # walking forward through the work hours.
+    book_start, book_end = START_DATE + datetime.timedelta(days=400), START_DATE + datetime.timedelta(days=4000)
+    slots = availability.iter_available_slots(
+        availability.CompiledConfig(bench_config()), book_start, book_end, timezones.UTC,
+        service.busy_intervals('primary', *timezones.day_bounds(timezones.UTC, book_start, book_end)),
+    )
+
+    async def book():
+        slot_start, slot_end = next(slots)
+        response = await client.post("/api/v1/book", json={
+            "start_time": slot_start.isoformat(),
+            "end_time": slot_end.isoformat(),
+            "user_details": {"name": "bench"},
+        })
+        assert response.status_code == 200, response.text
+
+    results["book"] = summarize(await timed_async(book, iterations))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latencies = []
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/v1/token", data={"username": USERNAME, "password": PASSWORD})
+            login_latencies.append(time.perf_counter() - started)
+            return response
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    results["login"] = summarize(
+        login_latencies, requests_per_second=logins / elapsed,
+        rejected=sum(1 for response in responses if response.status_code != 200),
+    )
+
+    token = next(response for response in responses if response.status_code == 200).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def get_unauthenticated():
+        assert (await client.get("/api/v1/initial-setup")).status_code == 200
+
+    async def get_authenticated():
+        assert (await client.get("/api/v1/users/me", headers=headers)).status_code == 200
+
+    unauthenticated = summarize(await timed_async(get_unauthenticated, iterations * 5))
+    authenticated = summarize(await timed_async(get_authenticated, iterations * 5))
+    results["request/unauthenticated"] = unauthenticated
+    results["request/authenticated"] = dict(
+        authenticated, overhead_ms=authenticated["median_ms"] - unauthenticated["median_ms"]
+    )
+    return results
+
+
+async def run_endpoints(service, iterations, logins, concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return await bench_endpoints(client, service, iterations, logins, concurrency)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        crud.create_config(db, bench_config())
+        crud.create_user(db, models.UserCreate(username=USERNAME, password=PASSWORD), auth.get_password_hash(PASSWORD))
+    finally:
+        db.close()
+    config_cache.clear()
+
+
+def run(args):
+    range_days, time_zones, densities = (
+        (QUICK_RANGE_DAYS, QUICK_TIME_ZONES, QUICK_BUSY_DENSITIES) if args.quick
+        else (RANGE_DAYS, TIME_ZONES, BUSY_DENSITIES)
+    )
+    if args.densities:
+        densities = tuple(float(density) for density in args.densities.split(","))
+
+    setup_database()
+    service = FakeCalendarService(busy_density=densities[-1], latency_seconds=args.google_latency_ms / 1000)
+    main.app.dependency_overrides[api.get_calendar_service] = lambda: service
+
+    benchmarks = bench_slot_generation(range_days, time_zones, densities, args.iterations)
+    benchmarks.update(asyncio.run(run_endpoints(service, args.iterations, args.logins, args.concurrency)))
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {
+                "quick": args.quick,
+                "iterations": args.iterations,
+                "logins": args.logins,
+                "concurrency": args.concurrency,
+                "google_latency_ms": args.google_latency_ms,
+                "busy_densities": list(densities),
+            },
+        },
+        "benchmarks": benchmarks,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="JSON file to write the results to (default: stdout only)")
+    parser.add_argument("--quick", action="store_true", help="fewer range sizes, timezones and densities")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--densities", help="comma separated busy densities, e.g. 0.1,0.5,0.9")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--google-latency-ms", type=float, default=0.0, help="simulated Google round trip")
+    args = parser.parse_args()
+
+    results = run(args)
+    for name, result in results["benchmarks"].items():
+        print(f"{name:<55} median {result['median_ms']:9.3f} ms   p95 {result['p95_ms']:9.3f} ms")
+    if args.output:
+        path = os.path.join(INVOCATION_DIR, args.output)
+        with open(path, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {path}")
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,172 @@
+"""
+Local ledger of bookings made through the API.
+
+A booking first claims its slot with a "pending" row, then the Google event
+is created and the row is confirmed; if the insert fails the claim is
+released. The unique (calendar_id, slot_start) constraint makes two claims on
+the same slot impossible, and a claim that overlaps another active one is
+rolled back. The overlap check only holds if concurrent claims on a calendar,
+from any worker process, run one after the other: SQLite serializes writers,
+and on other databases a claim first locks the calendar's booking_locks row
+with SELECT ... FOR UPDATE, so under READ COMMITTED it then sees every claim
+committed before it.
+
+Confirming a booking drops the precomputed availability of its days from
+availability_store, which does not store days again from busy times that may
+predate the booking (missed_by_fetch).
+
+Pending claims older than BOOKING_CLAIM_TTL_SECONDS are considered abandoned
+(e.g. the worker died mid-booking) and no longer block the slot. Confirmed
+claims block it for BOOKING_CONFIRMED_HOLD_SECONDS after confirmation, the
+time it takes every worker's cached free/busy answers to include the new
+event; after that Google is the source of truth, so a booking cancelled in
+Google Calendar frees its slot. Availability subtracts the active claims
+without asking Google, and a claim replaces the inactive rows it overlaps.
+"""
+import datetime
+import os
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import availability_store
+import freebusy_cache
+import models
+import timezones
+from circuit_breaker import GOOGLE_CALL_TIMEOUT_SECONDS
+from google_calendar import PRIMARY_CALENDAR
+
+BOOKING_CLAIM_TTL_SECONDS = float(os.getenv("BOOKING_CLAIM_TTL_SECONDS", "120"))
+# A free/busy answer fetched just before the event existed may be cached for
+# the cache TTL after a call that took up to the call timeout.
+BOOKING_CONFIRMED_HOLD_SECONDS = float(os.getenv(
+    "BOOKING_CONFIRMED_HOLD_SECONDS", str(freebusy_cache.FREEBUSY_CACHE_TTL_SECONDS + GOOGLE_CALL_TIMEOUT_SECONDS)
+))
+
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+
+
+class SlotTakenError(Exception):
+    """The requested slot overlaps a booking that is already claimed or confirmed."""
+
+
+def _overlapping(db: Session, calendar_id: str, start: datetime.datetime, end: datetime.datetime):
+    return db.query(models.Booking).filter(
+        models.Booking.calendar_id == calendar_id,
+        models.Booking.slot_start < end,
+        models.Booking.slot_end > start,
+    )
+
+
+def _is_active(now: datetime.datetime):
+    """Pending claims younger than the claim TTL and confirmed ones within the hold."""
+    return or_(
+        and_(
+            models.Booking.status == PENDING,
+            models.Booking.claimed_at >= now - datetime.timedelta(seconds=BOOKING_CLAIM_TTL_SECONDS),
+        ),
+        and_(
+            models.Booking.status == CONFIRMED,
+            models.Booking.claimed_at >= now - datetime.timedelta(seconds=BOOKING_CONFIRMED_HOLD_SECONDS),
+        ),
+    )
+
+
+def _lock_calendar(db: Session, calendar_id: str):
+    """Holds the calendar's booking lock until the transaction ends."""
+    if db.get_bind().dialect.name == "sqlite":
+        return
+    locked = db.query(models.BookingLock).filter(models.BookingLock.calendar_id == calendar_id).with_for_update()
+    if locked.first() is None:
+        # The first claim on a calendar creates its lock row; a concurrent one waits on it.
+        try:
+            with db.begin_nested():
+                db.add(models.BookingLock(calendar_id=calendar_id))
+        except IntegrityError:
+            locked.one()
+
+
+def claim(db: Session, start_time: datetime.datetime, end_time: datetime.datetime, calendar_id: str = PRIMARY_CALENDAR):
+    """Claims a slot and returns the booking id. Raises SlotTakenError on conflict."""
+    start, end = timezones.to_utc_naive(start_time), timezones.to_utc_naive(end_time)
+    now = datetime.datetime.utcnow()
+    _lock_calendar(db, calendar_id)
+
+    # Abandoned claims and aged-out bookings on this slot must not block it through the unique constraint.
+    _overlapping(db, calendar_id, start, end).filter(~_is_active(now)).delete(synchronize_session=False)
+
+    booking = models.Booking(
+        calendar_id=calendar_id, slot_start=start, slot_end=end, status=PENDING, claimed_at=now
+    )
+    db.add(booking)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise SlotTakenError()
+
+    conflict = _overlapping(db, calendar_id, start, end).filter(_is_active(now), models.Booking.id != booking.id).first()
+    if conflict:
+        db.rollback()
+        raise SlotTakenError()
+    db.commit()
+    return booking.id
+
+
+def confirm(db: Session, booking_id: int, event_id: str):
+    booking = db.get(models.Booking, booking_id)
+    booking.status = CONFIRMED
+    booking.event_id = event_id
+    # The hold runs from when Google has the event.
+    booking.claimed_at = datetime.datetime.utcnow()
+    availability_store.invalidate_range(
+        db,
+        booking.slot_start.replace(tzinfo=datetime.timezone.utc),
+        booking.slot_end.replace(tzinfo=datetime.timezone.utc),
+        booking.calendar_id,
+    )
+    db.commit()
+
+
+def release(db: Session, booking_id: int):
+    """Compensates a claim whose Google event could not be created."""
+    db.rollback()
+    db.query(models.Booking).filter(
+        models.Booking.id == booking_id, models.Booking.status == PENDING
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def forget_event(db: Session, event_id: str, calendar_id: str = PRIMARY_CALENDAR):
+    """Frees the slot of a booking whose event was cancelled in Google."""
+    db.query(models.Booking).filter(
+        models.Booking.calendar_id == calendar_id, models.Booking.event_id == event_id
+    ).delete(synchronize_session=False)
+
+
+def missed_by_fetch(db: Session, fetched_at: datetime.datetime, start_time: datetime.datetime, end_time: datetime.datetime, calendar_id: str = PRIMARY_CALENDAR):
+    """
+    Whether busy times requested at fetched_at (naive UTC) may lack the event
+    of a booking in the range: one confirmed less than the hold before, or after.
+    """
+    since = fetched_at - datetime.timedelta(seconds=BOOKING_CONFIRMED_HOLD_SECONDS)
+    confirmed = _overlapping(db, calendar_id, timezones.to_utc_naive(start_time), timezones.to_utc_naive(end_time)).filter(
+        models.Booking.status == CONFIRMED, models.Booking.claimed_at >= since
+    )
+    return confirmed.first() is not None
+
+
+def get_busy_times(db: Session, start_time: datetime.datetime, end_time: datetime.datetime, calendar_id: str = PRIMARY_CALENDAR):
+    """Active claims in the range, in the format of google_calendar.get_busy_times."""
+    bookings = _overlapping(db, calendar_id, timezones.to_utc_naive(start_time), timezones.to_utc_naive(end_time)).filter(
+        _is_active(datetime.datetime.utcnow())
+    )
+    return [
+        {
+            'start': booking.slot_start.replace(tzinfo=datetime.timezone.utc),
+            'end': booking.slot_end.replace(tzinfo=datetime.timezone.utc),
+        }
+        for booking in bookings
+    ]
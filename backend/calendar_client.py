@@ -0,0 +1,179 @@
+"""
+Async access to Google Calendar for the API endpoints.
+
+The Google client library only offers blocking calls. Instead of letting them
+occupy the default threadpool that serves every sync endpoint, they run on a
+dedicated, bounded executor. A semaphore caps how many calls may be queued or
+running, each call has a timeout, and the circuit breaker in circuit_breaker
+makes calls fail fast while Google keeps failing. A call whose caller timed
+out keeps its place under the cap until it leaves the executor, so a slow
+Google cannot pile up work behind the executor's threads; it only slows down
+the calendar endpoints.
+
+Calls that take the request's database session first end its transaction,
+so the session's pooled connection is not held while the call waits for
+Google; local queries are made once Google has answered.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import booking_ledger
+import circuit_breaker
+import event_mirror
+import freebusy_cache
+import google_calendar
+from circuit_breaker import GOOGLE_CALL_TIMEOUT_SECONDS, CalendarTimeoutError, CalendarUnavailableError
+
+GOOGLE_MAX_CONCURRENCY = int(os.getenv("GOOGLE_MAX_CONCURRENCY", "8"))
+GOOGLE_MAX_PENDING = int(os.getenv("GOOGLE_MAX_PENDING", "64"))
+
+
+class AsyncCalendarClient:
+    def __init__(self, max_concurrency: int, max_pending: int, timeout_seconds: float, breaker):
+        self.timeout_seconds = timeout_seconds
+        self.breaker = breaker
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.timeouts = 0
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="google-calendar")
+        self._slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, function, *args):
+        """Runs a blocking calendar operation on the dedicated executor, with a timeout."""
+        if self._slots.locked():
+            raise CalendarUnavailableError("Too many pending Google Calendar requests. Please try again later.")
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        # Like run_in_threadpool, keep the request's context variables (e.g. its metrics).
+        context = contextvars.copy_context()
+        call = self._executor.submit(functools.partial(context.run, function, *args))
+        self.pending += 1
+        # The slot is freed when the call leaves the executor, not when its caller stops waiting.
+        call.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            # On timeout a call still queued is cancelled; a running one cannot be.
+            return await asyncio.wait_for(asyncio.wrap_future(call), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            # The breaker counts the call as failed when it eventually completes.
+            self.timeouts += 1
+            raise CalendarTimeoutError("Google Calendar did not answer in time. Please try again later.")
+
+    def _release(self):
+        self.pending -= 1
+        self._slots.release()
+
+    async def get_service(self):
+        """google_calendar.get_calendar_service, whose credential refresh is a network call."""
+        return await self.run(google_calendar.get_calendar_service)
+
+    async def call(self, function, service, *args):
+        """
+        Runs function(service, *args) through run(). The executor thread uses
+        its own service instance, since httplib2 connections are not thread-safe.
+        """
+        return await self.run(_with_thread_service, function, service, *args)
+
+    async def _release_connection(self, db: Session):
+        """Ends db's transaction; the session checks out a connection again when next used."""
+        if db.in_transaction():
+            await run_in_threadpool(db.commit)
+
+    async def get_busy_times(self, service, db: Session, time_min, time_max):
+        """
+        Busy intervals from the local event mirror when enabled, otherwise from
+        the free/busy cache, plus the slots claimed in the booking ledger.
+        """
+        await self._release_connection(db)
+        return await self.call(_busy_times, service, db, time_min, time_max)
+
+    async def get_calendar_busy_times(self, service, db: Session, time_min, time_max, raise_errors: bool = False):
+        """Like get_busy_times, without the booking ledger claims."""
+        await self._release_connection(db)
+        return await self.call(calendar_busy_times, service, db, time_min, time_max, raise_errors)
+
+    async def get_busy_times_many(self, service, db: Session, calendar_ids, time_min, time_max):
+        """
+        Busy intervals of several calendars as a dict of calendar ID to
+        intervals, including the slots claimed in the booking ledger. The
+        calendars are queried FREEBUSY_MAX_CALENDARS at a time, in parallel.
+        """
+        await self._release_connection(db)
+        chunk_size = google_calendar.FREEBUSY_MAX_CALENDARS
+        chunks = [calendar_ids[offset:offset + chunk_size] for offset in range(0, len(calendar_ids), chunk_size)]
+        results = await asyncio.gather(
+            *(self.call(google_calendar.query_busy_times_many, service, chunk, time_min, time_max) for chunk in chunks)
+        )
+        busy_times = {}
+        for result in results:
+            busy_times.update(result)
+        claimed_many = await run_in_threadpool(_claimed_many, db, calendar_ids, time_min, time_max)
+        for calendar_id, claimed in claimed_many.items():
+            busy_times[calendar_id] = busy_times[calendar_id] + claimed
+        return busy_times
+
+    async def get_events(self, service, db: Session, time_min, time_max):
+        await self._release_connection(db)
+        return await self.call(_events, service, db, time_min, time_max)
+
+    async def create_event(self, service, start_time, end_time, summary: str, description: str = '', timezone: str = 'UTC'):
+        return await self.call(google_calendar.create_event, service, start_time, end_time, summary, description, timezone)
+
+    async def create_events_batch(self, service, events):
+        return await self.call(google_calendar.create_events_batch, service, events)
+
+    def stats(self):
+        return {
+            "timeouts": self.timeouts,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "max_concurrency": self.max_concurrency,
+            "pending_limit_reached": self._slots.locked(),
+            "circuit": self.breaker.stats(),
+        }
+
+
+def _with_thread_service(function, service, *args):
+    return function(google_calendar.calendar_service_holder.localize(service), *args)
+
+
+def calendar_busy_times(service, db: Session, time_min, time_max, raise_errors: bool = False):
+    """
+    Blocking: busy intervals of the primary calendar, from the event mirror
+    when enabled, otherwise from the free/busy cache (see its raise_errors).
+    """
+    if event_mirror.EVENT_MIRROR_ENABLED:
+        event_mirror.sync_if_stale(service, db)
+        return event_mirror.get_busy_times(db, time_min, time_max)
+    return freebusy_cache.get_busy_times(service, time_min, time_max, raise_errors)
+
+
+def _busy_times(service, db: Session, time_min, time_max):
+    busy_times = calendar_busy_times(service, db, time_min, time_max)
+    # Slots claimed in the booking ledger are busy even before Google knows about them.
+    return busy_times + booking_ledger.get_busy_times(db, time_min, time_max)
+
+
+def _claimed_many(db: Session, calendar_ids, time_min, time_max):
+    return {
+        calendar_id: booking_ledger.get_busy_times(db, time_min, time_max, calendar_id)
+        for calendar_id in calendar_ids
+    }
+
+
+def _events(service, db: Session, time_min, time_max):
+    if event_mirror.EVENT_MIRROR_ENABLED:
+        event_mirror.sync_if_stale(service, db)
+        return event_mirror.get_events(db, time_min, time_max)
+    return google_calendar.get_events(service, time_min, time_max)
+
+
+client = AsyncCalendarClient(
+    GOOGLE_MAX_CONCURRENCY, GOOGLE_MAX_PENDING, GOOGLE_CALL_TIMEOUT_SECONDS, circuit_breaker.google
+)
@@ -0,0 +1,131 @@
+"""
+Circuit breaker for calls to the Google Calendar API.
+
+After CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and
+calls fail immediately with CalendarUnavailableError. Failures are 5xx and 429
+answers, connection errors and timeouts, and calls slower than
+GOOGLE_CALL_TIMEOUT_SECONDS, whose callers have already given up on them.
+After CIRCUIT_RESET_SECONDS a single trial call is let through; its outcome
+closes the circuit again or reopens it.
+"""
+import os
+import socket
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+import metrics
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("GOOGLE_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("GOOGLE_CIRCUIT_RESET_SECONDS", "30"))
+GOOGLE_CALL_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_CALL_TIMEOUT_SECONDS", "15"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CalendarUnavailableError(Exception):
+    """Google Calendar is failing or too slow; the request should be retried later."""
+
+
+class CalendarTimeoutError(CalendarUnavailableError):
+    """The call was given up on while it may still be running, so it may yet take effect."""
+
+
+def is_failure(error: BaseException):
+    """Whether an error means Google is unhealthy, as opposed to rejecting this particular request."""
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500 or error.resp.status == 429
+    return isinstance(error, (CalendarUnavailableError, TimeoutError, socket.timeout, OSError, httplib2.HttpLib2Error))
+
+
+def _method_name(function):
+    """API method of a request's execute, e.g. calendar.freebusy.query, for metrics."""
+    request = getattr(function, '__self__', None)
+    method_id = getattr(request, 'methodId', None)
+    if method_id:
+        return method_id
+    if request is not None and type(request).__name__ == 'BatchHttpRequest':
+        return 'batch'
+    return getattr(function, '__qualname__', 'unknown')
+
+
+def _error_reason(error: BaseException):
+    if isinstance(error, HttpError):
+        return str(error.resp.status)
+    return type(error).__name__
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float, slow_call_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CalendarUnavailableError when the call must not reach Google."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == OPEN or (self.state == HALF_OPEN and self._trial_in_flight):
+                self.rejected += 1
+                raise CalendarUnavailableError("Google Calendar is temporarily unavailable. Please try again later.")
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, function, *args, **kwargs):
+        method = _method_name(function)
+        try:
+            self.before_call()
+        except CalendarUnavailableError:
+            metrics.google_api_errors_total.inc(method=method, reason="circuit_open")
+            raise
+        started = time.monotonic()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            metrics.google_api_call_seconds.observe(time.monotonic() - started, method=method)
+            metrics.google_api_errors_total.inc(method=method, reason=_error_reason(error))
+            if is_failure(error):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        elapsed = time.monotonic() - started
+        metrics.google_api_call_seconds.observe(elapsed, method=method)
+        if elapsed >= self.slow_call_seconds:
+            metrics.google_api_errors_total.inc(method=method, reason="slow")
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+google = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, GOOGLE_CALL_TIMEOUT_SECONDS)
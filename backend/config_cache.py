@@ -0,0 +1,102 @@
+"""
+Process-wide cache of the compiled availability configuration and of the
+compiled configuration of each resource.
+
+crud bumps the config_version row whenever the configuration or a resource is
+created, updated or deleted. Each request reads that single row and only
+parses and compiles the stored JSON again when the version differs from the
+cached one, so every worker process picks up changes made through any other
+worker.
+
+Async endpoints that call Google next use load_compiled_config and
+load_compiled_resources, which read on a short-lived session of their own:
+the request's session then holds no transaction, and no pooled connection,
+while it waits for Google.
+"""
+import threading
+
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from availability import CompiledConfig
+from database import SessionLocal
+
+_lock = threading.Lock()
+_compiled = None
+_resources = None
+
+
+def get_compiled_config(db: Session):
+    """Returns the CompiledConfig for the current config version, or None if no config exists."""
+    global _compiled
+    version = crud.get_config_version(db)
+    compiled = _compiled
+    if compiled is not None and compiled.version == version:
+        return compiled
+
+    with _lock:
+        compiled = _compiled
+        if compiled is not None and compiled.version == version:
+            return compiled
+        db_config = crud.get_config(db)
+        if not db_config:
+            _compiled = None
+            return None
+        compiled = CompiledConfig(models.AvailabilityConfig.parse_obj(db_config.data), version)
+        _compiled = compiled
+        return compiled
+
+
+def load_compiled_config():
+    """get_compiled_config on a short-lived session."""
+    db = SessionLocal()
+    try:
+        return get_compiled_config(db)
+    finally:
+        db.close()
+
+
+class CompiledResource:
+    def __init__(self, name: str, calendar_id: str, compiled: CompiledConfig):
+        self.name = name
+        self.calendar_id = calendar_id
+        self.compiled = compiled
+
+
+def get_compiled_resources(db: Session):
+    """Returns a dict of resource name to CompiledResource for the current config version."""
+    global _resources
+    version = crud.get_config_version(db)
+    resources = _resources
+    if resources is not None and resources[0] == version:
+        return resources[1]
+
+    with _lock:
+        resources = _resources
+        if resources is not None and resources[0] == version:
+            return resources[1]
+        compiled = {}
+        for db_resource in crud.get_resources(db):
+            resource = models.ResourceConfig.model_validate(db_resource)
+            compiled[resource.name] = CompiledResource(
+                resource.name, resource.calendar_id, CompiledConfig(resource.config, version)
+            )
+        _resources = (version, compiled)
+        return compiled
+
+
+def load_compiled_resources():
+    """get_compiled_resources on a short-lived session."""
+    db = SessionLocal()
+    try:
+        return get_compiled_resources(db)
+    finally:
+        db.close()
+
+
+def clear():
+    global _compiled, _resources
+    with _lock:
+        _compiled = None
+        _resources = None
@@ -0,0 +1,218 @@
+"""
+Google OAuth credentials shared by every worker through the database.
+
+The token lives in the single google_credentials row. Each process keeps the
+last loaded Credentials in memory and only goes back to the database when the
+access token has expired or the cached copy is older than
+CREDENTIAL_CACHE_TTL_SECONDS.
+
+When the token has expired, threads of the same process wait on a lock and
+processes compete for a short lease stored on the row: the lease holder
+refreshes and writes the new token with a bumped version, while the others
+poll until that version shows up and reuse it instead of refreshing again.
+Only the lease holder may drop the token after a RefreshError.
+"""
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+
+CREDENTIAL_CACHE_TTL_SECONDS = float(os.getenv("CREDENTIAL_CACHE_TTL_SECONDS", "60"))
+REFRESH_LEASE_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_LEASE_SECONDS", "30"))
+REFRESH_WAIT_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_WAIT_SECONDS", "15"))
+REFRESH_POLL_SECONDS = 0.2
+
+ROW_ID = 1
+
+
+class CredentialStore:
+    def __init__(self, scopes, session_factory=SessionLocal, legacy_token_file=None):
+        self.scopes = scopes
+        self.session_factory = session_factory
+        self.legacy_token_file = legacy_token_file
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.refreshes = 0
+        self.refreshes_avoided = 0
+        self._lock = threading.Lock()
+        self._creds = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def get_credentials(self):
+        """Returns valid (or, without a refresh token, the stored) credentials, or None if not authorized."""
+        creds = self._creds
+        if creds is not None and creds.valid and time.monotonic() - self._checked_at < CREDENTIAL_CACHE_TTL_SECONDS:
+            return creds
+        with self._lock:
+            creds = self._creds
+            if creds is not None and creds.valid and time.monotonic() - self._checked_at < CREDENTIAL_CACHE_TTL_SECONDS:
+                return creds
+            db = self.session_factory()
+            try:
+                return self._load(db)
+            finally:
+                db.close()
+
+    def save(self, creds: Credentials):
+        """Stores newly authorized credentials for every worker."""
+        db = self.session_factory()
+        try:
+            row = db.get(models.GoogleCredential, ROW_ID)
+            if row is None:
+                row = models.GoogleCredential(id=ROW_ID, version=0)
+                db.add(row)
+            row.data = creds.to_json()
+            row.version = (row.version or 0) + 1
+            row.refresh_lease_owner = None
+            row.refresh_lease_until = None
+            db.commit()
+            with self._lock:
+                self._adopt(creds, row.version)
+        finally:
+            db.close()
+
+    def clear(self):
+        """Drops the stored token, e.g. when the refresh token has been revoked."""
+        db = self.session_factory()
+        try:
+            db.query(models.GoogleCredential).filter(models.GoogleCredential.id == ROW_ID).delete()
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._creds = None
+            self._version = None
+
+    def stats(self):
+        return {"refreshes": self.refreshes, "refreshes_avoided": self.refreshes_avoided}
+
+    def _adopt(self, creds, version):
+        self._creds = creds
+        self._version = version
+        self._checked_at = time.monotonic()
+        return creds
+
+    def _from_row(self, row):
+        if row.version == self._version and self._creds is not None:
+            return self._creds
+        return Credentials.from_authorized_user_info(json.loads(row.data), self.scopes)
+
+    def _import_legacy_token_file(self, db):
+        """Moves a token.json written by earlier versions into the database."""
+        if not self.legacy_token_file or not os.path.exists(self.legacy_token_file):
+            return None
+        try:
+            creds = Credentials.from_authorized_user_file(self.legacy_token_file, self.scopes)
+        except FileNotFoundError:
+            # Another worker imported it in the meantime.
+            return db.get(models.GoogleCredential, ROW_ID)
+        db.add(models.GoogleCredential(id=ROW_ID, data=creds.to_json(), version=1))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        try:
+            os.remove(self.legacy_token_file)
+        except FileNotFoundError:
+            pass
+        return db.get(models.GoogleCredential, ROW_ID)
+
+    def _load(self, db):
+        row = db.get(models.GoogleCredential, ROW_ID) or self._import_legacy_token_file(db)
+        if row is None:
+            self._creds = None
+            self._version = None
+            return None
+        creds = self._from_row(row)
+        if creds.valid or not (creds.expired and creds.refresh_token):
+            return self._adopt(creds, row.version)
+        return self._refresh(db, row.version, creds)
+
+    def _acquire_lease(self, db):
+        now = datetime.datetime.utcnow()
+        result = db.execute(
+            update(models.GoogleCredential)
+            .where(models.GoogleCredential.id == ROW_ID)
+            .where(or_(models.GoogleCredential.refresh_lease_until.is_(None),
+                       models.GoogleCredential.refresh_lease_until < now))
+            .values(refresh_lease_owner=self.owner,
+                    refresh_lease_until=now + datetime.timedelta(seconds=REFRESH_LEASE_SECONDS))
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def _release_lease(self, db):
+        db.rollback()
+        db.execute(
+            update(models.GoogleCredential)
+            .where(models.GoogleCredential.id == ROW_ID)
+            .where(models.GoogleCredential.refresh_lease_owner == self.owner)
+            .values(refresh_lease_owner=None, refresh_lease_until=None)
+        )
+        db.commit()
+
+    def _refresh(self, db, expired_version, creds):
+        deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+        while True:
+            if self._acquire_lease(db):
+                return self._refresh_as_leaseholder(db, expired_version)
+
+            time.sleep(REFRESH_POLL_SECONDS)
+            db.expire_all()
+            row = db.get(models.GoogleCredential, ROW_ID)
+            if row is None:
+                self._creds = None
+                return None
+            if row.version != expired_version:
+                fresh = self._from_row(row)
+                if fresh.valid:
+                    self.refreshes_avoided += 1
+                    return self._adopt(fresh, row.version)
+            if time.monotonic() > deadline:
+                # The refresher is stuck; hand back what we have and let the lease expire.
+                return creds
+
+    def _refresh_as_leaseholder(self, db, expired_version):
+        try:
+            db.expire_all()
+            row = db.get(models.GoogleCredential, ROW_ID)
+            if row is None:
+                self._creds = None
+                return None
+            creds = self._from_row(row)
+            if row.version != expired_version and creds.valid:
+                # Another worker refreshed between our read and the lease.
+                self._release_lease(db)
+                self.refreshes_avoided += 1
+                return self._adopt(creds, row.version)
+            try:
+                creds.refresh(Request())
+            except RefreshError:
+                # The refresh token is expired or revoked, re-authentication is needed.
+                db.delete(row)
+                db.commit()
+                self._creds = None
+                self._version = None
+                return None
+            self.refreshes += 1
+            row.data = creds.to_json()
+            row.version = row.version + 1
+            row.refresh_lease_owner = None
+            row.refresh_lease_until = None
+            db.commit()
+            return self._adopt(creds, row.version)
+        except Exception:
+            self._release_lease(db)
+            raise
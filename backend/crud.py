@@ -1,7 +1,9 @@
 from sqlalchemy.orm import Session
 import models
 import json
-import auth
+import availability_store
+import user_cache
+from availability import CompiledConfig
 
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
@@ -10,39 +12,55 @@ def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+    return db.query(models.User).order_by(models.User.id).offset(skip).limit(limit).all()
 
-def create_user(db: Session, user: models.UserCreate):
-    hashed_password = auth.get_password_hash(user.password)
+def create_user(db: Session, user: models.UserCreate, hashed_password: str):
     db_user = models.User(username=user.username, hashed_password=hashed_password, is_admin=user.is_admin)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
-def update_user(db: Session, user: models.User, updates: models.UserUpdate):
-    if updates.password:
-        user.hashed_password = auth.get_password_hash(updates.password)
+def update_user(db: Session, user: models.User, updates: models.UserUpdate, hashed_password: str = None):
+    """Applies updates; a new password is applied as hashed_password, hashed by the caller."""
+    if hashed_password:
+        user.hashed_password = hashed_password
     if updates.is_admin is not None:
         user.is_admin = updates.is_admin
     db.commit()
     db.refresh(user)
+    user_cache.invalidate_user(user.username)
     return user
 
 def delete_user(db: Session, user: models.User):
     db.delete(user)
     db.commit()
+    user_cache.invalidate_user(user.username)
     return user
 
 def get_users_count(db: Session):
     return db.query(models.User).count()
 
 def get_config(db: Session):
-    return db.query(models.DbConfig).first()
+    return db.query(models.DbConfig).order_by(models.DbConfig.id).first()
+
+def get_config_version(db: Session):
+    row = db.get(models.ConfigVersion, 1)
+    return row.version if row else 0
+
+def bump_config_version(db: Session):
+    """Increments the config version as part of the caller's transaction."""
+    row = db.get(models.ConfigVersion, 1)
+    if row is None:
+        db.add(models.ConfigVersion(id=1, version=1))
+    else:
+        row.version = models.ConfigVersion.version + 1
 
 def create_config(db: Session, config: models.AvailabilityConfig):
     db_config = models.DbConfig(data=json.loads(config.json()))
     db.add(db_config)
+    availability_store.invalidate_calendar(db)
+    bump_config_version(db)
     db.commit()
     db.refresh(db_config)
     return db_config
@@ -50,7 +68,11 @@ def create_config(db: Session, config: models.AvailabilityConfig):
 def update_config(db: Session, config: models.AvailabilityConfig):
     db_config = get_config(db)
     if db_config:
+        availability_store.invalidate_config_change(
+            db, CompiledConfig(models.AvailabilityConfig.parse_obj(db_config.data)), CompiledConfig(config)
+        )
         db_config.data = json.loads(config.json())
+        bump_config_version(db)
         db.commit()
         db.refresh(db_config)
     return db_config
@@ -59,5 +81,33 @@ def delete_config(db: Session):
     db_config = get_config(db)
     if db_config:
         db.delete(db_config)
+        availability_store.invalidate_calendar(db)
+        bump_config_version(db)
         db.commit()
     return db_config
+
+def get_resources(db: Session):
+    return db.query(models.DbResource).order_by(models.DbResource.name).all()
+
+def get_resource_by_name(db: Session, name: str):
+    return db.query(models.DbResource).filter(models.DbResource.name == name).first()
+
+def upsert_resource(db: Session, resource: models.ResourceConfig):
+    db_resource = get_resource_by_name(db, resource.name)
+    if db_resource is None:
+        db_resource = models.DbResource(name=resource.name)
+        db.add(db_resource)
+    db_resource.calendar_id = resource.calendar_id
+    db_resource.config = json.loads(resource.config.json())
+    bump_config_version(db)
+    db.commit()
+    db.refresh(db_resource)
+    return db_resource
+
+def delete_resource(db: Session, name: str):
+    db_resource = get_resource_by_name(db, name)
+    if db_resource:
+        db.delete(db_resource)
+        bump_config_version(db)
+        db.commit()
+    return db_resource
@@ -0,0 +1,198 @@
+"""
+SQLite mirror of the primary Google Calendar.
+
+The first sync lists every event from EVENT_MIRROR_PAST_DAYS ago onwards and
+stores the nextSyncToken Google returns. Later syncs send that token and only
+receive what changed since, including cancelled events, which are removed.
+When Google answers 410 Gone the token has expired and a full resync is done.
+
+Availability and the admin agenda can then be served with range queries on
+calendar_events instead of calling Google on every request.
+"""
+import datetime
+import os
+import threading
+
+from googleapiclient.errors import HttpError
+from sqlalchemy.orm import Session
+
+import availability_store
+import booking_ledger
+import circuit_breaker
+import models
+import timezones
+from google_calendar import PRIMARY_CALENDAR
+
+EVENT_MIRROR_ENABLED = os.getenv("EVENT_MIRROR_ENABLED", "false").lower() in ("1", "true", "yes")
+EVENT_MIRROR_SYNC_INTERVAL_SECONDS = float(os.getenv("EVENT_MIRROR_SYNC_INTERVAL_SECONDS", "30"))
+EVENT_MIRROR_PAST_DAYS = int(os.getenv("EVENT_MIRROR_PAST_DAYS", "30"))
+
+PAGE_SIZE = 2500
+
+_sync_lock = threading.Lock()
+
+
+def _from_utc_naive(moment: datetime.datetime):
+    return moment.replace(tzinfo=datetime.timezone.utc)
+
+
+def _parse_event_time(value: dict, time_zone: str):
+    """Parses an event start/end, localizing all-day dates in the calendar's timezone."""
+    if 'dateTime' in value:
+        return timezones.to_utc_naive(datetime.datetime.fromisoformat(value['dateTime']))
+    day = datetime.date.fromisoformat(value['date'])
+    tz = timezones.get_timezone(time_zone or 'UTC')
+    return timezones.to_utc_naive(timezones.localize(tz, datetime.datetime.combine(day, datetime.time.min)))
+
+
+def _is_busy(event: dict):
+    """Mirrors how free/busy treats events: transparent and declined events are free."""
+    if event.get('transparency') == 'transparent':
+        return False
+    for attendee in event.get('attendees', []):
+        if attendee.get('self') and attendee.get('responseStatus') == 'declined':
+            return False
+    return True
+
+
+def _apply_event(db: Session, calendar_id: str, event: dict, time_zone: str):
+    existing = db.query(models.CalendarEvent).filter(
+        models.CalendarEvent.calendar_id == calendar_id,
+        models.CalendarEvent.event_id == event['id'],
+    ).first()
+
+    if event.get('status') == 'cancelled' or 'start' not in event:
+        if existing:
+            availability_store.invalidate_range(db, _from_utc_naive(existing.start), _from_utc_naive(existing.end), calendar_id)
+            db.delete(existing)
+        booking_ledger.forget_event(db, event['id'], calendar_id)
+        return
+
+    values = dict(
+        start=_parse_event_time(event['start'], time_zone),
+        end=_parse_event_time(event['end'], time_zone),
+        is_busy=_is_busy(event),
+        data=event,
+    )
+    # Only changes to when an event is, or whether it blocks time, affect availability.
+    if existing is None or (existing.start, existing.end, existing.is_busy) != (values['start'], values['end'], values['is_busy']):
+        if existing:
+            availability_store.invalidate_range(db, _from_utc_naive(existing.start), _from_utc_naive(existing.end), calendar_id)
+        availability_store.invalidate_range(db, _from_utc_naive(values['start']), _from_utc_naive(values['end']), calendar_id)
+    if existing:
+        for key, value in values.items():
+            setattr(existing, key, value)
+    else:
+        db.add(models.CalendarEvent(calendar_id=calendar_id, event_id=event['id'], **values))
+
+
+def _list_pages(service, calendar_id: str, **params):
+    """Yields every page of an events().list call, following nextPageToken."""
+    page_token = None
+    while True:
+        page = circuit_breaker.google.call(service.events().list(
+            calendarId=calendar_id, singleEvents=True, maxResults=PAGE_SIZE, pageToken=page_token, **params
+        ).execute)
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _apply_pages(db: Session, state: models.CalendarSyncState, pages):
+    for page in pages:
+        state.time_zone = page.get('timeZone', state.time_zone)
+        for event in page.get('items', []):
+            _apply_event(db, state.calendar_id, event, state.time_zone)
+        db.flush()
+        if page.get('nextSyncToken'):
+            state.sync_token = page['nextSyncToken']
+
+
+def full_sync(service, db: Session, calendar_id: str = PRIMARY_CALENDAR):
+    """Replaces the mirrored events of a calendar with a fresh listing."""
+    state = db.get(models.CalendarSyncState, calendar_id) or models.CalendarSyncState(calendar_id=calendar_id)
+    db.add(state)
+    db.query(models.CalendarEvent).filter(models.CalendarEvent.calendar_id == calendar_id).delete()
+    availability_store.invalidate_calendar(db, calendar_id)
+    state.sync_token = None
+    time_min = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=EVENT_MIRROR_PAST_DAYS)
+    try:
+        _apply_pages(db, state, _list_pages(service, calendar_id, timeMin=time_min.isoformat()))
+    except Exception:
+        db.rollback()
+        raise
+    state.synced_at = datetime.datetime.utcnow()
+    db.commit()
+
+
+def sync(service, db: Session, calendar_id: str = PRIMARY_CALENDAR):
+    """Applies the changes since the last sync, falling back to a full resync when needed."""
+    state = db.get(models.CalendarSyncState, calendar_id)
+    if not state or not state.sync_token:
+        full_sync(service, db, calendar_id)
+        return
+    try:
+        _apply_pages(db, state, _list_pages(service, calendar_id, syncToken=state.sync_token))
+    except HttpError as error:
+        db.rollback()
+        if error.resp.status != 410:
+            raise
+        # The sync token is no longer valid, start over.
+        full_sync(service, db, calendar_id)
+        return
+    except Exception:
+        db.rollback()
+        raise
+    state.synced_at = datetime.datetime.utcnow()
+    db.commit()
+
+
+def sync_if_stale(service, db: Session, calendar_id: str = PRIMARY_CALENDAR):
+    """
+    Syncs when the last sync, by any worker, is older than the sync interval.
+    Sync errors are logged and the mirror keeps serving its current contents.
+    """
+    state = db.get(models.CalendarSyncState, calendar_id)
+    max_age = datetime.timedelta(seconds=EVENT_MIRROR_SYNC_INTERVAL_SECONDS)
+    if state and state.sync_token and state.synced_at and datetime.datetime.utcnow() - state.synced_at < max_age:
+        return
+    with _sync_lock:
+        db.expire_all()
+        state = db.get(models.CalendarSyncState, calendar_id)
+        if state and state.sync_token and state.synced_at and datetime.datetime.utcnow() - state.synced_at < max_age:
+            return
+        try:
+            sync(service, db, calendar_id)
+        except (HttpError, circuit_breaker.CalendarUnavailableError) as error:
+            print(f'An error occurred while syncing the event mirror: {error}')
+
+
+def _overlapping(db: Session, calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    return db.query(models.CalendarEvent).filter(
+        models.CalendarEvent.calendar_id == calendar_id,
+        models.CalendarEvent.start < timezones.to_utc_naive(end_time),
+        models.CalendarEvent.end > timezones.to_utc_naive(start_time),
+    )
+
+
+def get_busy_times(db: Session, start_time: datetime.datetime, end_time: datetime.datetime, calendar_id: str = PRIMARY_CALENDAR):
+    """Mirror equivalent of google_calendar.get_busy_times."""
+    events = _overlapping(db, calendar_id, start_time, end_time).filter(models.CalendarEvent.is_busy.is_(True))
+    return [
+        {'start': _from_utc_naive(event.start), 'end': _from_utc_naive(event.end)}
+        for event in events.order_by(models.CalendarEvent.start)
+    ]
+
+
+def get_events(db: Session, start_time: datetime.datetime, end_time: datetime.datetime, calendar_id: str = PRIMARY_CALENDAR):
+    """Mirror equivalent of google_calendar.get_events."""
+    events = _overlapping(db, calendar_id, start_time, end_time).order_by(models.CalendarEvent.start)
+    return [event.data for event in events]
+
+
+def record_event(db: Session, event: dict, calendar_id: str = PRIMARY_CALENDAR):
+    """Stores an event created through the API without waiting for the next sync."""
+    state = db.get(models.CalendarSyncState, calendar_id)
+    _apply_event(db, calendar_id, event, state.time_zone if state else None)
+    db.commit()
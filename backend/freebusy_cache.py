@@ -0,0 +1,120 @@
+"""
+In-process cache for Google Calendar free/busy results.
+
+Entries are stored per (calendar, UTC day), so overlapping availability
+windows reuse the days they have in common and only the missing days are
+fetched from Google. Entries expire after a TTL and the least recently used
+ones are evicted once the cache is full.
+"""
+import datetime
+import os
+
+from googleapiclient.errors import HttpError
+
+import freebusy_coalescer
+from google_calendar import PRIMARY_CALENDAR
+from ttl_cache import TTLCache
+
+FREEBUSY_CACHE_TTL_SECONDS = float(os.getenv("FREEBUSY_CACHE_TTL_SECONDS", "60"))
+FREEBUSY_CACHE_MAX_DAYS = int(os.getenv("FREEBUSY_CACHE_MAX_DAYS", "2048"))
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+class FreeBusyCache(TTLCache):
+    """TTLCache of busy intervals keyed by (calendar, UTC day)."""
+
+    def get(self, calendar_id: str, day: datetime.date):
+        """Returns the busy intervals cached for the day, or None if missing or expired."""
+        return super().get((calendar_id, day))
+
+    def put(self, calendar_id: str, day: datetime.date, intervals: list):
+        super().put((calendar_id, day), intervals)
+
+    def invalidate(self, calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+        """Drops the cached days touched by the given time range."""
+        for day in utc_days(start_time, end_time):
+            self.pop((calendar_id, day))
+
+
+cache = FreeBusyCache(FREEBUSY_CACHE_MAX_DAYS, FREEBUSY_CACHE_TTL_SECONDS)
+
+
+def _utc_date(moment: datetime.datetime):
+    return moment.astimezone(datetime.timezone.utc).date()
+
+
+def _utc_midnight(day: datetime.date):
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def utc_days(start_time: datetime.datetime, end_time: datetime.datetime):
+    """Lists the UTC days covered by a time range."""
+    day = _utc_date(start_time)
+    last_day = _utc_date(end_time)
+    days = []
+    while day <= last_day:
+        days.append(day)
+        day += ONE_DAY
+    return days
+
+
+def _split_by_day(intervals, days):
+    """Assigns each interval to every UTC day it overlaps."""
+    per_day = {day: [] for day in days}
+    for interval in intervals:
+        day = max(_utc_date(interval['start']), days[0])
+        while day <= days[-1] and _utc_midnight(day) < interval['end']:
+            per_day[day].append(interval)
+            day += ONE_DAY
+    return per_day
+
+
+def get_busy_times(service, start_time: datetime.datetime, end_time: datetime.datetime, raise_errors: bool = False):
+    """
+    Cached equivalent of google_calendar.get_busy_times.
+    Missing days are fetched from Google as whole UTC days and stored for reuse.
+    When the fetch fails they are left out, or with raise_errors the HttpError
+    is raised, for callers that must not take the days as free.
+    """
+    days = utc_days(start_time, end_time)
+    per_day = {}
+    missing = []
+    for day in days:
+        intervals = cache.get(PRIMARY_CALENDAR, day)
+        if intervals is None:
+            missing.append(day)
+        else:
+            per_day[day] = intervals
+
+    if missing:
+        fetch_days = days[days.index(missing[0]):days.index(missing[-1]) + 1]
+        try:
+            fetched = freebusy_coalescer.query_busy_times(
+                service, _utc_midnight(fetch_days[0]), _utc_midnight(fetch_days[-1] + ONE_DAY)
+            )
+        except HttpError as error:
+            if raise_errors:
+                raise
+            # Errors are not cached, so the next request tries Google again.
+            print(f'An error occurred: {error}')
+            fetched = None
+        if fetched is not None:
+            for day, intervals in _split_by_day(fetched, fetch_days).items():
+                cache.put(PRIMARY_CALENDAR, day, intervals)
+                per_day[day] = intervals
+
+    busy_times = []
+    seen = set()
+    for day in days:
+        for interval in per_day.get(day, []):
+            key = (interval['start'], interval['end'])
+            if key in seen or interval['end'] <= start_time or interval['start'] >= end_time:
+                continue
+            seen.add(key)
+            busy_times.append(interval)
+    return busy_times
+
+
+def invalidate(start_time: datetime.datetime, end_time: datetime.datetime):
+    cache.invalidate(PRIMARY_CALENDAR, start_time, end_time)
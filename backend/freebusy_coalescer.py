@@ -0,0 +1,90 @@
+"""
+Single-flight layer in front of the Google free/busy query.
+
+While a query is in flight, any other caller whose window lies inside that
+query's window waits for its result instead of sending its own request to
+Google. Waiters get the leader's intervals clipped to their own window, which
+is what Google would have returned for it. Errors are propagated to every
+waiter, so nothing is retried behind the caller's back.
+"""
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+
+import google_calendar
+from google_calendar import PRIMARY_CALENDAR
+
+
+class _Flight:
+    def __init__(self, calendar_id: str, start_time: datetime, end_time: datetime):
+        self.calendar_id = calendar_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.future = Future()
+
+    def covers(self, calendar_id: str, start_time: datetime, end_time: datetime):
+        return self.calendar_id == calendar_id and self.start_time <= start_time and end_time <= self.end_time
+
+
+def _clip(intervals, start_time: datetime, end_time: datetime):
+    clipped = []
+    for interval in intervals:
+        if interval['end'] <= start_time or interval['start'] >= end_time:
+            continue
+        clipped.append({
+            'start': max(interval['start'], start_time),
+            'end': min(interval['end'], end_time),
+        })
+    return clipped
+
+
+class FreeBusyCoalescer:
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.issued = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight = []
+
+    def query(self, service, start_time: datetime, end_time: datetime, calendar_id: str = PRIMARY_CALENDAR):
+        with self._lock:
+            flight = next((f for f in self._in_flight if f.covers(calendar_id, start_time, end_time)), None)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = _Flight(calendar_id, start_time, end_time)
+                self._in_flight.append(flight)
+                self.issued += 1
+                leader = True
+
+        if not leader:
+            return _clip(flight.future.result(), start_time, end_time)
+
+        try:
+            result = self.fetch(service, start_time, end_time)
+        except BaseException as error:
+            flight.future.set_exception(error)
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.remove(flight)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "issued": self.issued,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
+
+
+coalescer = FreeBusyCoalescer(google_calendar.query_busy_times)
+
+
+def query_busy_times(service, start_time: datetime, end_time: datetime):
+    """Coalesced equivalent of google_calendar.query_busy_times; raises HttpError like it."""
+    return coalescer.query(service, start_time, end_time)
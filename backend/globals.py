@@ -1 +0,0 @@
-initial_admin_setup_needed = False
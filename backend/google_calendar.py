@@ -1,14 +1,19 @@
 import datetime
 import os.path
 import secrets
+import threading
+import weakref
+from typing import List
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.auth.exceptions import RefreshError
+import google_auth_httplib2
+import httplib2
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import circuit_breaker
+from credential_store import CredentialStore
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 REDIRECT_URI = 'http://127.0.0.1:8000'
@@ -19,7 +24,15 @@ REDIRECT_URI = 'http://127.0.0.1:8000'
 # ---
 
 CREDENTIALS_FILE = 'credentials.json'
-TOKEN_FILE = 'token.json'
+TOKEN_FILE = 'token.json'  # Only read to import tokens saved by earlier versions
+HTTP_TIMEOUT_SECONDS = float(os.getenv('GOOGLE_HTTP_TIMEOUT_SECONDS', '30'))
+# Google Calendar accepts at most 50 calls in a batch request.
+BATCH_MAX_REQUESTS = 50
+# Calendars per free/busy query (the API's calendarExpansionMax).
+FREEBUSY_MAX_CALENDARS = 50
+PRIMARY_CALENDAR = 'primary'
+
+credentials_store = CredentialStore(SCOPES, legacy_token_file=TOKEN_FILE)
 
 def get_google_auth_flow():
     """Creates a Google Auth Flow instance."""
@@ -51,70 +64,135 @@ def get_google_credentials_from_code(flow: Flow, code: str):
     """Fetches credentials from the authorization code."""
     flow.fetch_token(code=code)
     creds = flow.credentials
-    # Save the credentials for the next run
-    with open(TOKEN_FILE, 'w') as token:
-        token.write(creds.to_json())
+    # Save the credentials for the next run, for every worker
+    credentials_store.save(creds)
     return creds
 
 def get_credentials():
-    """Gets user credentials from storage."""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    
-    if creds and creds.expired and creds.refresh_token:
-        try:
-            creds.refresh(Request())
-            # Save the refreshed credentials
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-        except RefreshError:
-            # Refresh token is expired or invalid, need re-authentication
-            creds = None 
-            if os.path.exists(TOKEN_FILE):
-                os.remove(TOKEN_FILE) # Remove invalid token
-            
-    return creds
+    """
+    Gets user credentials from the shared store, refreshing them if expired.
+    A token.json left by earlier versions is imported on first use.
+    """
+    return credentials_store.get_credentials()
+
+def build_calendar_service(creds):
+    """
+    Builds a Calendar service from the discovery document bundled with
+    google-api-python-client, on top of its own persistent HTTP connection.
+    """
+    http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+    return build('calendar', 'v3', http=http, static_discovery=True, cache_discovery=False)
+
+class CalendarServiceHolder:
+    """
+    Long-lived source of Calendar service instances.
+
+    httplib2 connections are not thread-safe, so each thread keeps its own
+    service (and HTTP connection), built once and rebuilt only when the
+    credentials store hands out a different Credentials object, i.e. after a
+    re-authorization or a refresh done by another worker.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._built = weakref.WeakSet()
+
+    def get_service(self):
+        creds = get_credentials()
+        if not creds:
+            return None
+        local = self._local
+        if getattr(local, 'creds', None) is not creds:
+            local.service = build_calendar_service(creds)
+            local.creds = creds
+            self._built.add(local.service)
+        return local.service
+
+    def localize(self, service):
+        """
+        Swaps a service this holder built for another thread for the calling
+        thread's own one. Any other service object is returned unchanged.
+        """
+        if service is None or service not in self._built:
+            return service
+        return self.get_service() or service
+
+    def reset(self):
+        """Drops this thread's service; other threads rebuild when their credentials change."""
+        self._local.__dict__.clear()
+
+calendar_service_holder = CalendarServiceHolder()
 
 def get_calendar_service():
     """Returns an authorized Google Calendar service instance."""
-    creds = get_credentials()
-    if not creds:
-        return None # Indicate that authentication is needed
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service
+        return calendar_service_holder.get_service()
     except HttpError:
         return None
 
+def query_busy_times(service, start_time: datetime.datetime, end_time: datetime.datetime):
+    """
+    Fetches busy times from the primary calendar within a given time range.
+    Unlike get_busy_times, API errors are raised to the caller.
+    Raises circuit_breaker.CalendarUnavailableError while Google is failing.
+    """
+    events_result = circuit_breaker.google.call(service.freebusy().query(body={
+        'timeMin': start_time.isoformat(),
+        'timeMax': end_time.isoformat(),
+        'items': [{'id': PRIMARY_CALENDAR}],
+    }).execute)
+
+    busy_intervals = []
+    if 'calendars' in events_result:
+        for cal, data in events_result['calendars'].items():
+            busy_intervals.extend(_parse_busy(data['busy']))
+    return busy_intervals
+
+def query_busy_times_many(service, calendar_ids: List[str], start_time: datetime.datetime, end_time: datetime.datetime):
+    """
+    Fetches the busy times of up to FREEBUSY_MAX_CALENDARS calendars with a
+    single free/busy query, as a dict of calendar ID to busy intervals.
+    A calendar Google reports an error for (unknown, no access) is considered
+    busy over the whole range, so it never looks free by mistake.
+    """
+    events_result = circuit_breaker.google.call(service.freebusy().query(body={
+        'timeMin': start_time.isoformat(),
+        'timeMax': end_time.isoformat(),
+        'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+    }).execute)
+
+    calendars = events_result.get('calendars', {})
+    busy_times = {}
+    for calendar_id in calendar_ids:
+        data = calendars.get(calendar_id)
+        if data is None or data.get('errors'):
+            print(f"Free/busy error for calendar {calendar_id}: {data.get('errors') if data else 'missing'}")
+            busy_times[calendar_id] = [{'start': start_time, 'end': end_time}]
+        else:
+            busy_times[calendar_id] = _parse_busy(data.get('busy', []))
+    return busy_times
+
+def _parse_busy(intervals):
+    return [
+        {
+            'start': datetime.datetime.fromisoformat(interval['start']),
+            'end': datetime.datetime.fromisoformat(interval['end'])
+        }
+        for interval in intervals
+    ]
+
 def get_busy_times(service, start_time: datetime.datetime, end_time: datetime.datetime):
     """
     Fetches busy times from the primary calendar within a given time range.
     """
     try:
-        events_result = service.freebusy().query(body={
-            'timeMin': start_time.isoformat(),
-            'timeMax': end_time.isoformat(),
-            'items': [{'id': 'primary'}],
-        }).execute()
-        
-        busy_intervals = []
-        if 'calendars' in events_result:
-            for cal, data in events_result['calendars'].items():
-                for interval in data['busy']:
-                    busy_intervals.append({
-                        'start': datetime.datetime.fromisoformat(interval['start']),
-                        'end': datetime.datetime.fromisoformat(interval['end'])
-                    })
-        return busy_intervals
-
+        return query_busy_times(service, start_time, end_time)
     except HttpError as error:
         print(f'An error occurred: {error}')
         return []
 
-def create_event(service, start_time: datetime.datetime, end_time: datetime.datetime, summary: str, description: str = '', timezone: str = 'UTC'):
-    """Creates a new event in the primary calendar."""
-    event = {
+def event_body(start_time: datetime.datetime, end_time: datetime.datetime, summary: str, description: str = '', timezone: str = 'UTC'):
+    return {
         'summary': summary,
         'description': description,
         'start': {
@@ -126,11 +204,15 @@ def create_event(service, start_time: datetime.datetime, end_time: datetime.date
             'timeZone': timezone,
         },
     }
+
+def create_event(service, start_time: datetime.datetime, end_time: datetime.datetime, summary: str, description: str = '', timezone: str = 'UTC'):
+    """Creates a new event in the primary calendar."""
+    event = event_body(start_time, end_time, summary, description, timezone)
     try:
         print("--- Attempting to create Google Calendar event ---")
         print("Event data being sent:")
         print(event)
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
+        created_event = circuit_breaker.google.call(service.events().insert(calendarId=PRIMARY_CALENDAR, body=event).execute)
         print("--- Successfully created event ---")
         print("API Response:")
         print(created_event)
@@ -140,18 +222,35 @@ def create_event(service, start_time: datetime.datetime, end_time: datetime.date
         print(f"Error details: {error}")
         return None
 
+def create_events_batch(service, events):
+    """
+    Inserts up to BATCH_MAX_REQUESTS event bodies in the primary calendar with a
+    single HTTP batch request. Returns a (created_event, error) pair per event,
+    in order; exactly one of the two is None.
+    """
+    results = [(None, "No response from Google Calendar.")] * len(events)
+
+    def on_response(request_id, response, exception):
+        results[int(request_id)] = (None, str(exception)) if exception else (response, None)
+
+    batch = service.new_batch_http_request(callback=on_response)
+    for index, event in enumerate(events):
+        batch.add(service.events().insert(calendarId=PRIMARY_CALENDAR, body=event), request_id=str(index))
+    circuit_breaker.google.call(batch.execute)
+    return results
+
 def get_events(service, start_time: datetime.datetime, end_time: datetime.datetime):
     """
     Fetches events from the primary calendar within a given time range.
     """
     try:
-        events_result = service.events().list(
-            calendarId='primary',
+        events_result = circuit_breaker.google.call(service.events().list(
+            calendarId=PRIMARY_CALENDAR,
             timeMin=start_time.isoformat(),
             timeMax=end_time.isoformat(),
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        ).execute)
         return events_result.get('items', [])
     except HttpError as error:
         print(f'An error occurred: {error}')
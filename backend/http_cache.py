@@ -0,0 +1,63 @@
+"""
+HTTP validators for responses that are expensive to build but often unchanged.
+
+Endpoints compute a weak ETag from what their response is derived from, such
+as the config version, a fingerprint of the busy times and the query, before
+doing the work. When the request's If-None-Match already holds that ETag
+they answer 304 Not Modified with no body instead.
+
+Cache-Control max-age defaults to 0 for both /config and /availability: the
+browser revalidates on every view, which is cheap when the answer is 304,
+and a booking or a configuration change shows up at once. Raising
+AVAILABILITY_CACHE_MAX_AGE_SECONDS lets browsers skip the request entirely
+for that long, at the price of showing a slot booked meanwhile as free.
+"""
+import hashlib
+import json
+import os
+
+from fastapi import Request, Response
+
+CONFIG_CACHE_MAX_AGE_SECONDS = int(os.getenv("CONFIG_CACHE_MAX_AGE_SECONDS", "0"))
+AVAILABILITY_CACHE_MAX_AGE_SECONDS = int(os.getenv("AVAILABILITY_CACHE_MAX_AGE_SECONDS", "0"))
+
+
+def fingerprint(values):
+    """A short digest of a sequence of values with a stable repr, e.g. busy intervals."""
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(repr(value).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()[:32]
+
+
+def make_etag(*parts):
+    """A weak ETag for a response derived from the given JSON-serializable parts."""
+    encoded = json.dumps(parts, default=str, separators=(",", ":")).encode()
+    return f'W/"{hashlib.sha256(encoded).hexdigest()[:32]}"'
+
+
+def cache_headers(etag: str, max_age: int, vary: str = None):
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max_age}"}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def _opaque_tag(tag: str):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_fresh(request: Request, etag: str):
+    """Whether If-None-Match lists etag (weak comparison, as RFC 9110 requires for it)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_opaque_tag(tag) == _opaque_tag(etag) for tag in header.split(","))
+
+
+def not_modified(etag: str, max_age: int, vary: str = None):
+    return Response(status_code=304, headers=cache_headers(etag, max_age, vary))
@@ -1,6 +1,5 @@
-import pytz
 from fastapi import FastAPI, HTTPException, Depends, Request, status
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from typing import List, Dict, Any, Optional
 import datetime
 from datetime import timedelta
@@ -10,15 +9,38 @@ import crud
 import models
 import auth
 import google_calendar
-from database import SessionLocal, engine
+import availability_store
+from database import SessionLocal, engine, get_db
 from api import router as api_router
-import globals
+import circuit_breaker
+import metrics
+import profiling
+from auth import HashingBusyError
+from circuit_breaker import CalendarUnavailableError
+import app_state
 
 models.Base.metadata.create_all(bind=engine)
 
+metrics.instrument_engine(engine)
+
 app = FastAPI()
 
 app.include_router(api_router, prefix="/api/v1")
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.exception_handler(CalendarUnavailableError)
+async def calendar_unavailable_handler(request: Request, exc: CalendarUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(int(circuit_breaker.CIRCUIT_RESET_SECONDS))})
+
+@app.exception_handler(HashingBusyError)
+async def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -34,22 +56,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependency to get a DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @app.on_event("startup")
 async def startup_event():
     db = SessionLocal()
     try:
         # Check if any users exist
         user_count = crud.get_users_count(db)
-        if user_count == 0:
-            globals.initial_admin_setup_needed = True
+        app_state.init_setup_needed(db, user_count > 0)
 
         # Check if a configuration exists, if not, create a default one
         existing_config = crud.get_config(db)
@@ -72,21 +85,26 @@ async def startup_event():
     finally:
         db.close()
 
-google_auth_state = None
+    if availability_store.AVAILABILITY_STORE_ENABLED:
+        availability_store.refresh_job.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    availability_store.refresh_job.stop()
 
 # --- Google Calendar Integration ---
 
 @app.get("/auth/google")
-def auth_google():
+def auth_google(db: Session = Depends(get_db)):
     """
     Initiates the Google authentication flow by redirecting the user.
+    The state is stored in the database, so the callback may reach any worker.
     """
-    global google_auth_state
     try:
         flow = google_calendar.get_google_auth_flow()
         authorization_url, state = google_calendar.get_google_auth_url(flow)
         
-        google_auth_state = state
+        app_state.add_oauth_state(db, state)
         
         return RedirectResponse(authorization_url)
     except FileNotFoundError as e:
@@ -95,21 +113,18 @@ def auth_google():
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during authentication: {e}")
 
 @app.get("/")
-def read_root(code: Optional[str] = None, state: Optional[str] = None):
+def read_root(code: Optional[str] = None, state: Optional[str] = None, db: Session = Depends(get_db)):
     """
     Welcome endpoint and Google OAuth callback handler.
     """
-    global google_auth_state
-
-    
     if code and state:
-        if not google_auth_state or google_auth_state != state:
+        # Each state is accepted once, and only until it expires.
+        if not app_state.consume_oauth_state(db, state):
             raise HTTPException(status_code=400, detail="Invalid state parameter.")
 
         try:
             flow = google_calendar.get_google_auth_flow()
             google_calendar.get_google_credentials_from_code(flow, code)
-            google_auth_state = None
             return {"message": "Authentication successful. You can now use the API."}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"An error occurred while fetching tokens: {e}")
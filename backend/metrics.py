@@ -0,0 +1,238 @@
+"""
+In-process metrics in the Prometheus text format, served by /metrics.
+
+No client library or collector is needed: counters and histograms live in
+the process (each worker exposes its own) and are rendered on scrape. Values
+other modules already keep, such as cache and pool statistics, are sampled at
+render time by the functions passed to register_collector.
+
+MetricsMiddleware records the latency, status and number of database queries
+of every request; database queries are counted through instrument_engine.
+"""
+import bisect
+import contextvars
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, *extra):
+        return tuple(zip(self.labelnames, key)) + extra
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", self._labels(key, ("le", _format_value(float(bound)))), cumulative
+            yield self.name + "_bucket", self._labels(key, ("le", "+Inf")), count
+            yield self.name + "_sum", self._labels(key), total
+            yield self.name + "_count", self._labels(key), count
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def register_collector(collector):
+    """
+    Registers a function called on every render. It returns an iterable of
+    (name, kind, documentation, labels dict, value) tuples.
+    """
+    _collectors.append(collector)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    described = set()
+    for collector in _collectors:
+        for name, kind, documentation, labels, value in collector():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_format_labels(tuple(labels.items()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template.", ("method", "route")
+)
+http_requests_total = Counter(
+    "http_requests_total", "Requests served, by route template and status code.", ("method", "route", "status")
+)
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "Database queries issued while serving a request.", ("route",), QUERY_COUNT_BUCKETS
+)
+google_api_call_seconds = Histogram(
+    "google_api_call_duration_seconds", "Latency of Google Calendar API calls, by API method.", ("method",)
+)
+google_api_errors_total = Counter(
+    "google_api_errors_total", "Failed Google Calendar API calls, by API method and reason.", ("method", "reason")
+)
+slot_engine_seconds = Histogram(
+    "slot_engine_duration_seconds", "Time spent generating slots, by engine.", ("engine",)
+)
+slot_engine_days_total = Counter("slot_engine_days_total", "Days processed by the slot engine.", ("engine",))
+slot_engine_slots_total = Counter("slot_engine_slots_total", "Free slots produced by the slot engine.", ("engine",))
+slot_engine_busy_intervals_total = Counter(
+    "slot_engine_busy_intervals_total", "Busy intervals given to the slot engine.", ("engine",)
+)
+
+
+def record_slot_engine(engine: str, days: int, busy_intervals: int, slots: int, seconds: float):
+    slot_engine_seconds.observe(seconds, engine=engine)
+    slot_engine_days_total.inc(days, engine=engine)
+    slot_engine_busy_intervals_total.inc(busy_intervals, engine=engine)
+    slot_engine_slots_total.inc(slots, engine=engine)
+
+
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _count_query(*args):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+def instrument_engine(engine):
+    """Counts the queries run on the engine towards the current request."""
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+def _route_template(scope):
+    """The matched route's path template, e.g. /api/v1/users/{user_id}."""
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    # Depending on the FastAPI version, routes of an included router may not carry its prefix.
+    match = re.search(route.path_regex.pattern.lstrip("^"), scope["path"])
+    return (scope["path"][:match.start()] if match else "") + path_format
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and query count per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        status = [500]
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_queries.reset(token)
+            route = _route_template(scope)
+            http_request_seconds.observe(time.perf_counter() - started, method=scope["method"], route=route)
+            http_requests_total.inc(method=scope["method"], route=route, status=status[0])
+            db_queries_per_request.observe(queries[0], route=route)
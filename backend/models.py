@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, JSON, String, Boolean
+from sqlalchemy import Column, Integer, JSON, String, Boolean, Date, DateTime, Index, Text, UniqueConstraint
 from database import Base
 
 from pydantic import BaseModel
@@ -7,16 +7,111 @@ import datetime
 
 class DbConfig(Base):
     __tablename__ = "config"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     data = Column(JSON)
 
+class DbResource(Base):
+    """A bookable staff member or room: its own calendar and availability configuration."""
+    __tablename__ = "resources"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    calendar_id = Column(String, nullable=False)
+    config = Column(JSON, nullable=False)
+
+class ConfigVersion(Base):
+    """Single-row counter bumped on every configuration change, see config_cache."""
+    __tablename__ = "config_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 class User(Base):
     __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_admin = Column(Boolean, default=False)
 
+class CalendarEvent(Base):
+    """Local copy of a Google Calendar event, kept current by event_mirror."""
+    __tablename__ = "calendar_events"
+    id = Column(Integer, primary_key=True)
+    calendar_id = Column(String, nullable=False)
+    event_id = Column(String, nullable=False)
+    start = Column(DateTime, nullable=False)  # UTC
+    end = Column(DateTime, nullable=False)  # UTC
+    is_busy = Column(Boolean, default=True)
+    data = Column(JSON)
+
+    __table_args__ = (
+        UniqueConstraint("calendar_id", "event_id", name="uq_calendar_events_event"),
+        Index("ix_calendar_events_start", "calendar_id", "start"),
+        Index("ix_calendar_events_end", "calendar_id", "end"),
+    )
+
+class CalendarSyncState(Base):
+    __tablename__ = "calendar_sync_state"
+    calendar_id = Column(String, primary_key=True)
+    sync_token = Column(String)
+    time_zone = Column(String)
+    synced_at = Column(DateTime)  # UTC
+
+class GoogleCredential(Base):
+    """Single-row store for the Google OAuth token, shared by all workers (see credential_store)."""
+    __tablename__ = "google_credentials"
+    id = Column(Integer, primary_key=True)
+    data = Column(Text, nullable=False)  # Credentials.to_json()
+    version = Column(Integer, nullable=False, default=1)
+    refresh_lease_owner = Column(String, nullable=True)
+    refresh_lease_until = Column(DateTime, nullable=True)  # UTC
+
+class AppState(Base):
+    """Small named values shared by every worker, such as the setup flag and pending OAuth states (see app_state)."""
+    __tablename__ = "app_state"
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)  # JSON
+    expires_at = Column(DateTime, nullable=True, index=True)  # UTC, None for no expiry
+
+class Booking(Base):
+    """
+    Local claim on a slot, taken before the Google event is created so two
+    clients cannot book the same slot (see booking_ledger).
+    """
+    __tablename__ = "bookings"
+    id = Column(Integer, primary_key=True)
+    calendar_id = Column(String, nullable=False)
+    slot_start = Column(DateTime, nullable=False)  # UTC
+    slot_end = Column(DateTime, nullable=False)  # UTC
+    status = Column(String, nullable=False)  # "pending" until the Google event exists, then "confirmed"
+    event_id = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=False)  # UTC, when claimed, then when confirmed
+
+    __table_args__ = (
+        UniqueConstraint("calendar_id", "slot_start", name="uq_bookings_slot"),
+        Index("ix_bookings_end", "calendar_id", "slot_end"),
+        Index("ix_bookings_event", "calendar_id", "event_id"),
+    )
+
+class BookingLock(Base):
+    """One row per calendar, locked by booking_ledger.claim so claims on a calendar run one at a time."""
+    __tablename__ = "booking_locks"
+    calendar_id = Column(String, primary_key=True)
+
+class AvailabilityDay(Base):
+    """Free slots of one day of a calendar in one timezone, precomputed by availability_store."""
+    __tablename__ = "availability_days"
+    id = Column(Integer, primary_key=True)
+    calendar_id = Column(String, nullable=False)
+    time_zone = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    weekday = Column(Integer, nullable=False)  # 0=Monday, 6=Sunday
+    slots = Column(JSON, nullable=False)  # As served by /api/v1/availability
+    computed_at = Column(DateTime, nullable=False)  # UTC
+
+    __table_args__ = (
+        UniqueConstraint("calendar_id", "time_zone", "day", name="uq_availability_days_day"),
+        Index("ix_availability_days_weekday", "calendar_id", "weekday"),
+    )
+
 class UserBase(BaseModel):
     username: str
 
@@ -56,11 +151,22 @@ class AvailabilityConfig(BaseModel):
     breaks: Optional[List[BreakRule]] = None
     appointment_duration_minutes: int = 60
 
+class ResourceConfig(BaseModel):
+    name: str
+    calendar_id: str
+    config: AvailabilityConfig
+
+    class Config:
+        from_attributes = True
+
 class BookingRequest(BaseModel):
     start_time: datetime.datetime
     end_time: datetime.datetime
     user_details: dict
 
+class BulkBookingRequest(BaseModel):
+    bookings: List[BookingRequest]
+
 class SetupStatus(BaseModel):
     setup_needed: bool
 
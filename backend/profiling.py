@@ -0,0 +1,246 @@
+"""
+Opt-in request profiling for admins.
+
+Adding profile=true to the query string of a request made with an admin's
+bearer token runs the request under a sampling profiler. The response carries
+an X-Profile-Id header; the profile is read back with
+GET /api/v1/profiles/{id} (phase timings and the functions seen in the most
+samples) or GET /api/v1/profiles/{id}/collapsed (collapsed stacks, for
+flamegraph.pl or speedscope).
+
+The sampler records the stack of every busy thread of the process every
+PROFILE_SAMPLE_INTERVAL_MS, so work sent to the threadpool and to the Google
+client threads is included, and so is the wall time spent waiting on Google.
+While other threads are busy the sampler also waits for the GIL, so samples
+are at least the interpreter's switch interval (5 ms by default) apart.
+Other requests served at the same time are sampled too: profile on a quiet
+worker when possible. Profiles are kept in memory, per worker process, the
+PROFILE_MAX_STORED most recent ones.
+
+phase() times the named steps of a request. Requests without profile=true
+only cost the middleware a look at the query string, and phase() then
+returns a shared no-op context manager.
+"""
+import collections
+import contextlib
+import contextvars
+import datetime
+import os
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+import auth
+from database import SessionLocal
+
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "20"))
+PROFILE_TOP_FUNCTIONS = 30
+
+# Innermost frames of a thread waiting for work: any frame of these files, or
+# a concurrent.futures worker blocked on its queue (a C call, so no frame of its own).
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+_IDLE_FUNCTIONS = {("thread.py", "_worker")}
+
+_current = contextvars.ContextVar("profile", default=None)
+_no_phase = contextlib.nullcontext()
+
+
+def _is_idle(code):
+    return code.co_filename.endswith(_IDLE_FILES) or (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCTIONS
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    def __init__(self, method: str, path: str, query: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.query = query
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.status = None
+        self.duration = None
+        self.samples = 0
+        self.stacks = collections.Counter()
+        self.phases = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _sample(self):
+        interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+        sampler = threading.get_ident()
+        while not self._stop.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler or _is_idle(frame.f_code):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """One 'outer;...;inner count' line per distinct stack."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = PROFILE_TOP_FUNCTIONS):
+        """Functions by samples spent in their own code, with their samples including callees."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+        samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": function,
+                "self_samples": own_count,
+                "total_samples": total[function],
+                "self_percent": round(100 * own_count / samples, 1),
+                "total_percent": round(100 * total[function] / samples, 1),
+            }
+            for function, own_count in own.most_common(limit)
+        ]
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": self.duration * 1000 if self.duration is not None else None,
+            "samples": self.samples,
+            "phases": {
+                name: {"ms": seconds * 1000, "calls": calls} for name, (seconds, calls) in self.phases.items()
+            },
+        }
+
+    def report(self):
+        return {**self.summary(), "top_functions": self.top_functions()}
+
+
+class _Phase:
+    def __init__(self, profile: Profile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        totals = self.profile.phases.setdefault(self.name, [0.0, 0])
+        totals[0] += time.perf_counter() - self.started
+        totals[1] += 1
+
+
+def phase(name: str):
+    """Context manager adding the time spent in its block to the named phase of the profiled request."""
+    profile = _current.get()
+    if profile is None:
+        return _no_phase
+    return _Phase(profile, name)
+
+
+class ProfileStore:
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self._profiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self):
+        """Stored profiles, most recent first."""
+        with self._lock:
+            return list(reversed(self._profiles.values()))
+
+
+store = ProfileStore(PROFILE_MAX_STORED)
+
+
+def _wants_profile(scope):
+    values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+    return bool(values) and values[-1].lower() in ("1", "true", "yes")
+
+
+def _authorize_admin(scope):
+    """Raises the HTTPException auth raises unless the request carries an admin's bearer token."""
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    db = SessionLocal()
+    try:
+        auth.get_current_admin_user(auth.get_current_active_user(auth.get_current_user(token, db)))
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that ask for it with profile=true."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or b"profile=" not in scope["query_string"] or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await run_in_threadpool(_authorize_admin, scope)
+        except HTTPException as error:
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+            await response(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], scope["query_string"].decode("latin-1"))
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        token = _current.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            _current.reset(token)
+            store.add(profile)
@@ -0,0 +1,71 @@
+"""
+Representations of the slot lists served by /api/v1/availability.
+
+The full format, the default, is a list of {"start_time", "end_time"} dicts
+with two ISO 8601 strings each. The compact format groups the slots by local
+day and sends the slot starts as minutes after the start of the day, with
+the duration given once:
+
+    {"duration_minutes": 30,
+     "days": [{"start": "2030-01-07T00:00:00-06:00", "offsets": [480, 510, 540]}]}
+
+A slot starts at its day's start plus its offset, counted in absolute time,
+so the offsets stay correct on the days with a DST transition, and ends
+duration_minutes later. Clients ask for it with format=compact or by
+accepting COMPACT_MEDIA_TYPE; format= wins when both are given.
+"""
+import datetime
+from typing import Optional
+
+from fastapi import Request
+
+import timezones
+
+FULL = "full"
+COMPACT = "compact"
+COMPACT_MEDIA_TYPE = "application/vnd.reservaciones.slots-compact+json"
+ONE_MINUTE = datetime.timedelta(minutes=1)
+
+
+def negotiate(request: Request, requested: Optional[str]):
+    """The format to answer with: the format query parameter if given, else from the Accept header."""
+    if requested is not None:
+        return requested
+    return COMPACT if COMPACT_MEDIA_TYPE in request.headers.get("accept", "") else FULL
+
+
+def media_type(slot_format: str):
+    return COMPACT_MEDIA_TYPE if slot_format == COMPACT else "application/json"
+
+
+def _minutes(delta: datetime.timedelta):
+    minutes, remainder = divmod(delta, ONE_MINUTE)
+    return minutes if not remainder else delta / ONE_MINUTE
+
+
+def compact(slots, user_tz, duration_minutes: int):
+    """The compact form of a list of full-format slots in user_tz, all duration_minutes long."""
+    days = []
+    current_day = None
+    for slot in slots:
+        start_time = slot["start_time"]
+        if start_time[:10] != current_day:
+            current_day = start_time[:10]
+            day = datetime.date.fromisoformat(current_day)
+            day_start = timezones.localize(user_tz, datetime.datetime.combine(day, datetime.time.min))
+            # With a single UTC offset all day, a slot's offset is its wall clock time.
+            single_offset = timezones.day_tzinfo(user_tz, day) is not None
+            offsets = []
+            days.append({"start": day_start.isoformat(), "offsets": offsets})
+        if single_offset and start_time[17:19] == "00" and start_time[19] != ".":
+            offsets.append(int(start_time[11:13]) * 60 + int(start_time[14:16]))
+        else:
+            offsets.append(_minutes(datetime.datetime.fromisoformat(start_time) - day_start))
+    return {"duration_minutes": duration_minutes, "days": days}
+
+
+def encode(slots, slot_format: str, user_tz, duration_minutes: int):
+    """The slots in the given format."""
+    if slot_format == COMPACT:
+        return compact(slots, user_tz, duration_minutes)
+    return slots
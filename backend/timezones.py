@@ -0,0 +1,100 @@
+"""
+Timezones for slot generation, on the standard library's zoneinfo.
+
+Local wall times become instants with these rules:
+- a wall time skipped by a DST gap is moved forward by the length of the gap
+  (02:30 on a day the clocks jump from 02:00 to 03:00 becomes 03:30),
+- a wall time repeated by a DST fold is its first occurrence, as in RFC 5545.
+Slots are then stepped in absolute time, so every slot lasts exactly the
+appointment duration, even across a transition.
+
+Almost every day has a single UTC offset from midnight to midnight.
+day_tzinfo() caches, per (timezone, date), a fixed-offset tzinfo for those
+days, so a wall time is localized with a plain datetime.combine and
+datetime arithmetic stays absolute; only the few days with a transition go
+through zoneinfo's full resolution.
+"""
+import datetime
+import functools
+import os
+import zoneinfo
+
+UTC = datetime.timezone.utc
+ONE_DAY = datetime.timedelta(days=1)
+
+TZ_OFFSET_CACHE_DAYS = int(os.getenv("TZ_OFFSET_CACHE_DAYS", "65536"))
+
+
+class UnknownTimeZoneError(ValueError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _keys_by_lower_case():
+    return {key.lower(): key for key in zoneinfo.available_timezones()}
+
+
+@functools.lru_cache(maxsize=1024)
+def get_timezone(name: str):
+    """The ZoneInfo for an IANA name, matched case-insensitively like pytz did."""
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except zoneinfo.ZoneInfoNotFoundError:
+        key = _keys_by_lower_case().get(name.lower())
+        if key is None:
+            raise UnknownTimeZoneError(name)
+        return zoneinfo.ZoneInfo(key)
+    except ValueError:
+        raise UnknownTimeZoneError(name)
+
+
+@functools.lru_cache(maxsize=None)
+def _fixed(offset: datetime.timedelta):
+    return datetime.timezone(offset)
+
+
+@functools.lru_cache(maxsize=TZ_OFFSET_CACHE_DAYS)
+def day_tzinfo(tz, day: datetime.date):
+    """
+    A fixed-offset tzinfo equal to tz for the whole local day, or None when
+    the UTC offset changes during the day (or at its midnight).
+    """
+    midnight = datetime.datetime.combine(day, datetime.time.min, tzinfo=tz)
+    next_midnight = datetime.datetime.combine(day + ONE_DAY, datetime.time.min, tzinfo=tz)
+    offsets = {
+        midnight.utcoffset(), midnight.replace(fold=1).utcoffset(),
+        next_midnight.utcoffset(), next_midnight.replace(fold=1).utcoffset(),
+    }
+    if len(offsets) != 1:
+        return None
+    return _fixed(offsets.pop())
+
+
+def wall_time(tz, day: datetime.date, time: datetime.time):
+    """
+    The instant of a local wall time, as an aware datetime whose arithmetic is
+    absolute: in the day's fixed offset, or in UTC on a transition day.
+    """
+    day_tz = day_tzinfo(tz, day)
+    if day_tz is not None:
+        return datetime.datetime.combine(day, time, tzinfo=day_tz)
+    # zoneinfo resolves fold=0 to the first occurrence in a fold and past the gap in a gap.
+    return datetime.datetime.combine(day, time, tzinfo=tz).astimezone(UTC)
+
+
+def localize(tz, moment: datetime.datetime):
+    """Attaches tz to a naive local datetime, following the gap and fold rules above."""
+    return moment.replace(tzinfo=tz).astimezone(UTC).astimezone(tz)
+
+
+def to_utc_naive(moment: datetime.datetime):
+    """An aware datetime as the naive UTC datetime stored in DateTime columns."""
+    return moment.astimezone(UTC).replace(tzinfo=None)
+
+
+def day_bounds(tz, start_date: datetime.date, end_date: datetime.date):
+    """The first and last instants of a range of local days, as the free/busy query bounds."""
+    return (
+        localize(tz, datetime.datetime.combine(start_date, datetime.time.min)),
+        localize(tz, datetime.datetime.combine(end_date, datetime.time.max)),
+    )
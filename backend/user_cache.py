@@ -0,0 +1,33 @@
+"""
+In-process caches for authentication.
+
+users maps a username to a detached UserInDB for USER_CACHE_TTL_SECONDS, so
+authenticated requests don't query the users table every time. crud drops the
+entry whenever a user is updated or deleted, so privilege changes apply
+immediately in this worker; the short TTL bounds how long other workers may
+keep serving the old values.
+
+tokens maps the SHA-256 of a bearer token to the username it was issued for,
+until the token's own expiry, so the same JWT is not decoded again and again.
+"""
+import hashlib
+import os
+
+from ttl_cache import TTLCache
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "1024"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096"))
+TOKEN_CACHE_MAX_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_MAX_TTL_SECONDS", "3600"))
+
+users = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+# Entries are also bounded by the token's own "exp" claim, see auth.get_current_user.
+tokens = TTLCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_MAX_TTL_SECONDS)
+
+
+def token_key(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def invalidate_user(username: str):
+    users.pop(username)